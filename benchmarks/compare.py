@@ -0,0 +1,46 @@
+import sys
+import json
+import argparse
+
+
+def load_stages(path):
+    """(scale, stage) -> result for one pipeline benchmark file"""
+    with open(path) as result_file:
+        report = json.load(result_file)
+    stages = {(run['scale'], stage): result for run in report['runs'] for stage, result in run['stages'].items()}
+    return report, stages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare two pipeline benchmark results (benchmarks/pipeline.py)")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative slowdown or memory growth reported as a regression")
+    args = parser.parse_args()
+
+    baseline, baseline_stages = load_stages(args.baseline)
+    candidate, candidate_stages = load_stages(args.candidate)
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    for field in ('settings', 'databases'):
+        if baseline.get(field) != candidate.get(field):
+            print(f"Warning: {field} differ ({baseline.get(field)} vs {candidate.get(field)})")
+
+    regressions = 0
+    print(f"{'scale':>6} {'stage':<20} {'wall s':>18} {'change':>8} {'peak RSS MB':>22} {'change':>8}")
+    for key in sorted(baseline_stages.keys() & candidate_stages.keys()):
+        old, new = baseline_stages[key], candidate_stages[key]
+        if 'wall_s' not in old or 'wall_s' not in new:
+            print(f"{key[0]:>6g} {key[1]:<20} {old.get('error', '')} {new.get('error', '')}")
+            continue
+
+        wall_change = new['wall_s'] / old['wall_s'] - 1 if old['wall_s'] else 0
+        rss_change = new['peak_rss_mb'] / old['peak_rss_mb'] - 1
+        flag = ''
+        if wall_change > args.threshold or rss_change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{key[0]:>6g} {key[1]:<20} {old['wall_s']:>8.2f} -> {new['wall_s']:<6.2f} {wall_change:>+8.0%} "
+              f"{old['peak_rss_mb']:>9.0f} -> {new['peak_rss_mb']:<9.0f} {rss_change:>+8.0%}{flag}")
+
+    # Non-zero exit status so a CI step can fail on regressions
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import threading
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+import pandas as pd
+from aiohttp import web
+from sqlalchemy import create_engine
+
+# Make the DAG modules importable when run from the project root
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DAGS_DIR = os.path.join(BENCHMARK_DIR, '..', 'dags')
+sys.path.insert(0, DAGS_DIR)
+from minifig_etl import storage, surrogate_keys, transform, warehouse
+from minifig_etl.instrumentation import peak_rss_mb
+from synthetic_data import RAW_TABLE_CATEGORIES, SQL_TABLES, generate
+
+# Environment variables that change how the pipeline runs; recorded with every result so runs stay comparable
+SETTING_PREFIXES = ('STORAGE_', 'SQL_', 'API_', 'TRANSFORM_', 'JOIN_', 'LOOKUP_', 'DUCKDB_', 'WAREHOUSE_', 'SURROGATE_', 'KEEP_TRANSFORMED')
+SECRET_SETTINGS = {'API_KEY', 'API_URL'}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def start_stub_api(port, page_size):
+    """Serve `stub['records']` like the paginated Rebrickable endpoint (count / next / results) on a background thread.
+
+    Each `(status, headers)` in `stub['errors']` answers one request before the pages are served again.
+    """
+    stub = {'records': [], 'errors': []}
+    path = '/api/v3/lego/minifigs/'
+
+    async def handle(request):
+        if stub['errors']:
+            status, headers = stub['errors'].pop(0)
+            return web.Response(status=status, headers=headers)
+        records = stub['records']
+        page = int(request.query.get('page', 1))
+        size = int(request.query.get('page_size', page_size))
+        start = (page - 1) * size
+        next_url = f"http://127.0.0.1:{port}{path}?page={page + 1}&page_size={size}" if start + size < len(records) else None
+        return web.json_response({'count': len(records), 'next': next_url, 'results': records[start:start + size]})
+
+    app = web.Application()
+    app.router.add_get(path, handle)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    os.environ['API_URL'] = f"http://127.0.0.1:{port}{path}?page_size={page_size}"
+    os.environ.setdefault('API_KEY', 'benchmark')
+    return stub
+
+
+def run_stage(stage, workdir, db_url, results):
+    """Run one pipeline stage in this (fresh) process and report its wall time and peak RSS"""
+    os.chdir(workdir)
+    import full_etl
+
+    # The DAG builds its connection strings from POSTGRES_*; point them at the benchmark databases instead
+    full_etl.create_engine = lambda url, **kwargs: create_engine(db_url, **kwargs)
+    stages = {
+        'ingest_sql': full_etl.ingest_sql_source,
+        'ingest_api': full_etl.ingest_api_data,
+        'transform': full_etl.transforming_data,
+        'load': full_etl.load_to_postgres,
+        'transform_and_load': full_etl.transform_and_load,
+    }
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    stages[stage]()
+    results.put({'wall_s': round(time.perf_counter() - start, 3), 'peak_rss_mb': round(peak_rss_mb(), 1),
+                 'rss_before_mb': round(rss_before, 1)})
+
+
+def timed_stage(stage, workdir, db_url):
+    """Run a stage in a spawned process, like an Airflow task, so peak RSS is measured per stage"""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_stage, args=(stage, workdir, db_url, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {'error': f"exit code {process.exitcode}"}
+    return results.get()
+
+
+def benchmark_scale(scale, args, stub):
+    """Generate the data for one scale factor and time every stage on a cold working directory"""
+    workdir = os.path.abspath(os.path.join(args.workdir, f"scale-{scale:g}"))
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    warehouse_url = args.warehouse_url or f"sqlite:///{os.path.join(workdir, 'warehouse.db')}"
+
+    start = time.perf_counter()
+    tables = generate(scale, args.seed)
+    rows = {table: len(df) for table, df in tables.items()}
+    print(f"Scale {scale:g}: generated {sum(rows.values()):,} rows in {time.perf_counter() - start:.1f}s")
+
+    if args.source_url:
+        # Source database for ingest_sql_source (bulk-loaded, not timed)
+        source_engine = create_engine(args.source_url)
+        for table in SQL_TABLES:
+            warehouse.copy_frame_to_table(source_engine, tables[table], table)
+        source_engine.dispose()
+    else:
+        # No source database: write the raw SQL tables directly and skip the SQL ingestion stage
+        for table in SQL_TABLES:
+            storage.write_table(tables[table], os.path.join(workdir, 'data', 'raw', RAW_TABLE_CATEGORIES[table]), table)
+
+    stub['records'] = json.loads(tables['minifigs'].to_json(orient='records'))
+    del tables
+
+    transform_inputs = sorted({table for inputs in transform.OUTPUT_DEPENDENCIES.values() for table in inputs})
+    stage_rows = {
+        'ingest_sql': sum(rows[table] for table in SQL_TABLES),
+        'ingest_api': rows['minifigs'],
+        'transform': sum(rows[table] for table in transform_inputs),
+    }
+    stages = ['ingest_sql', 'ingest_api']
+    stages += ['transform_and_load'] if os.getenv('TRANSFORM_LOAD_MODE') == 'fused' else ['transform', 'load']
+    if not args.source_url:
+        stages.remove('ingest_sql')
+
+    results = {}
+    for stage in stages:
+        result = timed_stage(stage, workdir, args.source_url if stage == 'ingest_sql' else warehouse_url)
+        if stage in ('load', 'transform_and_load') and 'error' not in result:
+            # Rows that reached the warehouse
+            stage_rows[stage] = sum(
+                len(storage.read_table(os.path.join(workdir, 'data', 'transformed'), table))
+                for table in surrogate_keys.transformed_tables(transform.OUTPUT_BUILDERS)
+            )
+        if stage in stage_rows and 'wall_s' in result:
+            result['rows'] = stage_rows[stage]
+            result['rows_per_s'] = round(stage_rows[stage] / result['wall_s'], 1) if result['wall_s'] else None
+        results[stage] = result
+        print(f"  {stage}: {result}")
+
+    return {'scale': scale, 'table_rows': rows, 'stages': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on synthetic Rebrickable data and write the results as JSON")
+    parser.add_argument('--scale', type=float, nargs='+', default=[1], help="Scale factors to run (e.g. 1 10 100)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--source-url', help="Scratch PostgreSQL database for the SQL source (its tables are replaced); "
+                                             "without it the SQL ingestion stage is skipped")
+    parser.add_argument('--warehouse-url', help="Warehouse database (PostgreSQL, or SQLite for the pandas load mode); "
+                                                "defaults to a SQLite file in the working directory")
+    parser.add_argument('--workdir', default='./data/benchmark', help="Each scale runs in a fresh <workdir>/scale-<n> folder")
+    parser.add_argument('--api-port', type=int, default=8765)
+    parser.add_argument('--api-page-size', type=int, default=1000)
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/pipeline-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    stub = start_stub_api(args.api_port, args.api_page_size)
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {key: value for key, value in sorted(os.environ.items())
+                     if key.startswith(SETTING_PREFIXES) and key not in SECRET_SETTINGS},
+        # Database kinds only (no credentials)
+        'databases': {
+            'source': args.source_url.split(':')[0] if args.source_url else None,
+            'warehouse': args.warehouse_url.split(':')[0] if args.warehouse_url else 'sqlite',
+        },
+        'runs': [benchmark_scale(scale, args, stub) for scale in args.scale],
+    }
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, 'results', f"pipeline-{commit}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {output}")
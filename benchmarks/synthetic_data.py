@@ -0,0 +1,215 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+# Make the DAG helper modules importable when run from the project root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+from minifig_etl import storage
+from minifig_etl.transform import REL_TYPE_MAPPING
+
+# Rows per table at scale factor 1 (about a tenth of the Rebrickable catalogue; 10x is roughly full size).
+# Colours, part categories and themes are small reference tables and do not grow with the scale factor.
+BASE_ROWS = {
+    'colors': 270,
+    'part_categories': 70,
+    'themes': 480,
+    'sets': 2_500,
+    'parts': 6_000,
+    'part_relationships': 3_000,
+    'elements': 10_000,
+    'minifigs': 1_500,
+    'inventories': 3_800,
+    'inventory_parts': 120_000,
+    'inventory_minifigs': 2_000,
+    'inventory_sets': 400,
+}
+FIXED_TABLES = {'colors', 'part_categories', 'themes'}
+
+# Tables served by the source database; minifigs come from the API
+SQL_TABLES = [table for table in BASE_ROWS if table != 'minifigs']
+
+# Raw layer layout, as in full_etl.RAW_TABLE_CATEGORIES (not imported: the DAG module needs Airflow)
+RAW_TABLE_CATEGORIES = {
+    'inventories': 'inventory_tbl', 'inventory_minifigs': 'inventory_tbl', 'inventory_parts': 'inventory_tbl',
+    'inventory_sets': 'inventory_tbl', 'minifigs': 'rebrickable_minifigs', 'colors': 'parts_tbl',
+    'elements': 'parts_tbl', 'part_categories': 'parts_tbl', 'part_relationships': 'parts_tbl', 'parts': 'parts_tbl',
+    'sets': 'sets_tbl', 'themes': 'sets_tbl',
+}
+
+PART_MATERIALS = ['Plastic', 'Rubber', 'Cloth', 'Flexible Plastic', 'Metal', 'Foam', 'Cardboard/Paper']
+CDN = 'https://cdn.rebrickable.com/media'
+
+
+def table_rows(scale):
+    """Row count of each table at a scale factor"""
+    return {table: rows if table in FIXED_TABLES else int(rows * scale) for table, rows in BASE_ROWS.items()}
+
+
+def skewed_choice(rng, n_keys, size, exponent=1.1):
+    """Zipf-like sample of key positions: a few keys (popular parts, common colours) take most of the rows"""
+    weights = 1.0 / np.arange(1, n_keys + 1) ** exponent
+    ranks = rng.choice(n_keys, size=size, p=weights / weights.sum())
+    return rng.permutation(n_keys)[ranks]   # Popular keys are spread over the key range, not the first ids
+
+
+def numbered(prefix, n, width=0, suffix=''):
+    return prefix + pd.Series(np.arange(1, n + 1)).astype(str).str.zfill(width) + suffix
+
+
+def generate(scale=1, seed=42):
+    """Rebrickable-shaped tables (source table -> DataFrame) with realistic key cardinalities and skew"""
+    rng = np.random.default_rng(seed)
+    rows = table_rows(scale)
+
+    n_colors = rows['colors']
+    colors = pd.DataFrame({
+        'id': np.arange(-1, n_colors - 1),   # -1 is Rebrickable's "[Unknown]" colour
+        'name': numbered('Color ', n_colors),
+        'rgb': pd.Series(rng.integers(0, 0xFFFFFF, n_colors)).map('{:06X}'.format),
+        'is_trans': rng.random(n_colors) < 0.15,
+        'num_parts': rng.lognormal(6, 2, n_colors).astype(int),
+        'num_sets': rng.lognormal(4, 2, n_colors).astype(int),
+        'y1': rng.integers(1949, 2025, n_colors),
+    })
+    colors['y2'] = np.minimum(colors['y1'] + rng.integers(0, 40, n_colors), 2025)
+
+    part_categories = pd.DataFrame({
+        'id': np.arange(1, rows['part_categories'] + 1),
+        'name': numbered('Category ', rows['part_categories']),
+    })
+
+    n_themes = rows['themes']
+    themes = pd.DataFrame({
+        'id': np.arange(1, n_themes + 1),
+        'name': numbered('Theme ', n_themes),
+        # About a fifth of the themes are roots; the rest hang off an earlier theme
+        'parent_id': pd.array(
+            np.where(rng.random(n_themes) < 0.2, 0, rng.integers(1, np.maximum(np.arange(1, n_themes + 1), 2))),
+            dtype='Int32',
+        ),
+    })
+    themes.loc[themes['parent_id'] == 0, 'parent_id'] = pd.NA
+    themes.loc[0, 'parent_id'] = pd.NA
+
+    n_sets = rows['sets']
+    set_nums = (pd.Series(rng.permutation(np.arange(10_000, 10_000 + n_sets * 10))[:n_sets]).astype(str) + '-1')
+    sets = pd.DataFrame({
+        'set_num': set_nums,
+        'name': numbered('Set ', n_sets),
+        'year': np.minimum(2025 - rng.exponential(12, n_sets).astype(int), 2025).clip(1949),   # Mostly recent sets
+        'theme_id': themes['id'].to_numpy()[skewed_choice(rng, n_themes, n_sets, 0.9)],
+        'num_parts': rng.lognormal(4.5, 1.3, n_sets).astype(int),
+        'img_url': f'{CDN}/sets/' + set_nums + '.jpg',
+    })
+
+    n_parts = rows['parts']
+    base_parts = pd.Series(np.arange(3001, 3001 + n_parts)).astype(str)
+    # Roughly a third of the parts are prints or patterns of another part ("3001pr0001")
+    printed = rng.random(n_parts) < 0.35
+    part_nums = base_parts.where(~printed, base_parts + 'pr' + pd.Series(np.arange(n_parts)).astype(str).str.zfill(4))
+    parts = pd.DataFrame({
+        'part_num': part_nums,
+        'name': numbered('Part ', n_parts),
+        'part_cat_id': part_categories['id'].to_numpy()[skewed_choice(rng, len(part_categories), n_parts, 0.8)],
+        'part_material': rng.choice(PART_MATERIALS, n_parts, p=[0.94, 0.02, 0.01, 0.01, 0.01, 0.005, 0.005]),
+    })
+
+    n_relationships = rows['part_relationships']
+    part_relationships = pd.DataFrame({
+        'rel_type': rng.choice(list(REL_TYPE_MAPPING), n_relationships, p=[0.45, 0.05, 0.1, 0.2, 0.15, 0.05]),
+        'child_part_num': part_nums.to_numpy()[rng.integers(0, n_parts, n_relationships)],
+        'parent_part_num': part_nums.to_numpy()[skewed_choice(rng, n_parts, n_relationships, 1.2)],
+    })
+
+    n_elements = rows['elements']
+    elements = pd.DataFrame({
+        'element_id': pd.Series(rng.permutation(np.arange(4_000_000, 4_000_000 + n_elements * 4))[:n_elements]).astype(str),
+        'part_num': part_nums.to_numpy()[skewed_choice(rng, n_parts, n_elements)],
+        'color_id': colors['id'].to_numpy()[skewed_choice(rng, n_colors, n_elements, 1.3)],
+        'design_id': pd.array(np.where(rng.random(n_elements) < 0.9, rng.integers(3001, 99999, n_elements), 0), dtype='Int64'),
+    })
+    elements.loc[elements['design_id'] == 0, 'design_id'] = pd.NA
+
+    n_minifigs = rows['minifigs']
+    fig_nums = numbered('fig-', n_minifigs, width=6)
+    minifigs = pd.DataFrame({
+        'set_num': fig_nums,
+        'name': numbered('Minifig ', n_minifigs),
+        'num_parts': rng.integers(3, 12, n_minifigs),
+        'set_img_url': f'{CDN}/sets/' + fig_nums + '.jpg',
+        'set_url': 'https://rebrickable.com/minifigs/' + fig_nums + '/',
+        'last_modified_dt': (pd.Timestamp('2020-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 5 * 365 * 86400, n_minifigs), unit='s'))
+        .strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+    })
+
+    # Inventories belong to sets (most) or minifigs; a few sets have a second version
+    n_inventories = rows['inventories']
+    is_minifig = rng.random(n_inventories) < 0.15
+    inventories = pd.DataFrame({
+        'id': np.arange(1, n_inventories + 1),
+        'version': np.where(rng.random(n_inventories) < 0.05, 2, 1),
+        'set_num': np.where(
+            is_minifig,
+            fig_nums.to_numpy()[rng.integers(0, n_minifigs, n_inventories)],
+            set_nums.to_numpy()[rng.integers(0, n_sets, n_inventories)],
+        ),
+    })
+
+    # Inventory sizes are long-tailed; popular parts and colours dominate every inventory
+    n_inventory_parts = rows['inventory_parts']
+    inventory_weights = rng.lognormal(0, 1.2, n_inventories)
+    part_index = skewed_choice(rng, n_parts, n_inventory_parts)
+    color_index = skewed_choice(rng, n_colors, n_inventory_parts, 1.3)
+    inventory_parts = pd.DataFrame({
+        'inventory_id': rng.choice(inventories['id'].to_numpy(), n_inventory_parts, p=inventory_weights / inventory_weights.sum()),
+        'part_num': part_nums.to_numpy()[part_index],
+        'color_id': colors['id'].to_numpy()[color_index],
+        'quantity': rng.geometric(0.4, n_inventory_parts),
+        'is_spare': rng.random(n_inventory_parts) < 0.08,
+        # One image per part and colour
+        'img_url': f'{CDN}/parts/elements/' + pd.Series(part_index * n_colors + color_index).astype(str) + '.jpg',
+    }).drop_duplicates(subset=['inventory_id', 'part_num', 'color_id', 'is_spare'])
+    inventory_parts = inventory_parts.sort_values('inventory_id', kind='stable').reset_index(drop=True)
+
+    n_inventory_minifigs = rows['inventory_minifigs']
+    inventory_minifigs = pd.DataFrame({
+        'inventory_id': inventories['id'].to_numpy()[rng.integers(0, n_inventories, n_inventory_minifigs)],
+        'fig_num': fig_nums.to_numpy()[skewed_choice(rng, n_minifigs, n_inventory_minifigs, 0.9)],
+        'quantity': np.where(rng.random(n_inventory_minifigs) < 0.9, 1, rng.integers(2, 5, n_inventory_minifigs)),
+    }).drop_duplicates(subset=['inventory_id', 'fig_num'])
+
+    n_inventory_sets = rows['inventory_sets']
+    inventory_sets = pd.DataFrame({
+        'inventory_id': inventories['id'].to_numpy()[rng.integers(0, n_inventories, n_inventory_sets)],
+        'set_num': set_nums.to_numpy()[rng.integers(0, n_sets, n_inventory_sets)],
+        'quantity': np.where(rng.random(n_inventory_sets) < 0.85, 1, rng.integers(2, 10, n_inventory_sets)),
+    }).drop_duplicates(subset=['inventory_id', 'set_num'])
+
+    return {
+        'colors': colors,
+        'part_categories': part_categories,
+        'themes': themes,
+        'sets': sets,
+        'parts': parts,
+        'part_relationships': part_relationships,
+        'elements': elements,
+        'minifigs': minifigs,
+        'inventories': inventories,
+        'inventory_parts': inventory_parts,
+        'inventory_minifigs': inventory_minifigs,
+        'inventory_sets': inventory_sets,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic Rebrickable-shaped raw layer")
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='./data/raw', help="Raw data folder to write (laid out like the DAG's raw layer)")
+    args = parser.parse_args()
+
+    for table, df in generate(args.scale, args.seed).items():
+        path = storage.write_table(df, os.path.join(args.out, RAW_TABLE_CATEGORIES[table]), table)
+        print(f"{table}: {len(df):,} rows -> {path}")
@@ -1,47 +1,397 @@
 import os
+import queue
+import json
+import threading
 import requests
 import time
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from airflow import DAG
 from airflow.operators.python import PythonOperator, BranchPythonOperator     # BranchPythonOperator to skip the ingestion process when already done
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import glob
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from minifig_etl import api_client, instrumentation, join_planner, lookup_store, pushdown, storage, surrogate_keys, transform, transform_cache, transform_sharded, validation, warehouse
 
 # Load environment variables from .env file
 load_dotenv()
 
+# SQL extraction settings
+# 'pandas' reads each table fully into memory; 'stream' pages through a server-side cursor;
+# 'copy' streams the table with COPY ... TO STDOUT straight into the CSV file
+SQL_EXTRACT_MODE = os.getenv("SQL_EXTRACT_MODE", "pandas")
+SQL_EXTRACT_CHUNK_SIZE = int(os.getenv("SQL_EXTRACT_CHUNK_SIZE", "50000"))
+# Number of tables extracted at the same time (also the size of the connection pool)
+SQL_EXTRACT_WORKERS = int(os.getenv("SQL_EXTRACT_WORKERS", "4"))
+# 'none' extracts every source table with SELECT *; 'columns' selects only the columns the star schema reads;
+# 'joins' also has Postgres build the pre-joined datasets the transform uses (see minifig_etl/pushdown.py)
+SQL_PUSHDOWN = os.getenv("SQL_PUSHDOWN", "none")
+
+# 'full' re-extracts every table; 'incremental' only pulls rows past each table's stored watermark
+SQL_INGEST_MODE = os.getenv("SQL_INGEST_MODE", "full")
+WATERMARK_STATE_FILE = os.getenv("WATERMARK_STATE_FILE", "./data/state/sql_watermarks.json")
+
+# How each source table is tracked in incremental mode:
+#   {'watermark': col} - mostly append-only table; rows with col above the stored max are new. A content hash of the
+#                        rows at or below the stored max is checked too: if rows under an already-seen col changed or
+#                        were deleted, the table is re-extracted in full
+#   no entry           - re-extracted only when the table's content hash changes
+INCREMENTAL_STRATEGIES = {
+    'inventories': {'watermark': 'id'},
+    'inventory_parts': {'watermark': 'inventory_id'},
+    'inventory_minifigs': {'watermark': 'inventory_id'},
+    'inventory_sets': {'watermark': 'inventory_id'},
+}
+_watermark_lock = threading.Lock()
+
+# API ingestion settings
+# 'sync' walks the `next` links one page at a time; 'async' fetches pages concurrently (see minifig_etl/api_client.py)
+API_FETCH_MODE = os.getenv("API_FETCH_MODE", "sync")
+
+# Transform settings
+# Skip the transform (or rebuild only affected tables) when the raw inputs and transform code are unchanged
+TRANSFORM_CACHE = os.getenv("TRANSFORM_CACHE", "true").lower() == "true"
+# 'pandas' runs the eager merge chain; 'duckdb' runs the same star-schema logic as lazy SQL over the raw files
+TRANSFORM_ENGINE = os.getenv("TRANSFORM_ENGINE", "pandas")
+# dimension_parts and ft_inv_parts are built together, shard by shard (see minifig_etl/transform_sharded.py)
+SHARDED_BUILD = TRANSFORM_ENGINE == 'pandas' and transform_sharded.TRANSFORM_SHARDS > 1
+# Pre-joined datasets replace their source tables (the DuckDB engine runs its own joins over the raw files)
+PREJOINED_EXTRACT = SQL_PUSHDOWN == 'joins' and TRANSFORM_ENGINE == 'pandas'
+
+# Warehouse load settings
+# 'pandas' uses DataFrame.to_sql (row-wise INSERTs); 'copy' bulk-loads with COPY ... FROM STDIN;
+# 'merge' upserts into indexed tables on their natural keys through a staging table (see minifig_etl/warehouse.py)
+WAREHOUSE_LOAD_MODE = os.getenv("WAREHOUSE_LOAD_MODE", "pandas")
+
+# 'staged' transforms to ./data/transformed and loads from there in a second task; 'fused' runs one task
+# that hands each table to a loader thread as soon as it is built
+TRANSFORM_LOAD_MODE = os.getenv("TRANSFORM_LOAD_MODE", "staged")
+# Fused mode only: also write the transformed tables to disk (needed by TRANSFORM_CACHE to skip unchanged tables)
+KEEP_TRANSFORMED_FILES = os.getenv("KEEP_TRANSFORMED_FILES", "true").lower() == "true"
+# Fused mode only: built tables waiting for the loader (bounds the memory held by the handoff)
+TRANSFORM_LOAD_QUEUE_SIZE = int(os.getenv("TRANSFORM_LOAD_QUEUE_SIZE", "2"))
+# Task the branch jumps to when ingestion is skipped
+TRANSFORM_TASK_ID = "Transform_and_load_to_data_warehouse" if TRANSFORM_LOAD_MODE == 'fused' else "Transformed_ingested_data"
+
+# 'stage' runs one task per pipeline stage; 'table' runs one task per source table, per transform output
+# and per warehouse table, each depending only on the tables it reads
+DAG_TASK_GRANULARITY = os.getenv("DAG_TASK_GRANULARITY", "stage")
+
+# Transformed table -> warehouse table
+WAREHOUSE_TABLES = {
+    'dimension_sets': 'sets_dim',
+    'dimension_colors': 'colors_dim',
+    'dimension_parts': 'parts_dim',
+    'ft_inv_minifigs': 'inventory_minifigs_ft',
+    'ft_inv_sets': 'inventory_sets_ft',
+    'ft_inv_parts': 'inventory_parts_ft',
+    # Only written with SURROGATE_KEYS (see minifig_etl/surrogate_keys.py)
+    'dimension_minifigs': 'minifigs_dim',
+    'dimension_part_images': 'part_images_dim',
+}
+
+# Raw layer layout: source table -> category subfolder under ./data/raw
+RAW_TABLE_CATEGORIES = {
+    'inventories': 'inventory_tbl',
+    'inventory_minifigs': 'inventory_tbl',
+    'inventory_parts': 'inventory_tbl',
+    'inventory_sets': 'inventory_tbl',
+    'minifigs': 'rebrickable_minifigs',
+    'colors': 'parts_tbl',
+    'elements': 'parts_tbl',
+    'part_categories': 'parts_tbl',
+    'part_relationships': 'parts_tbl',
+    'parts': 'parts_tbl',
+    'sets': 'sets_tbl',
+    'themes': 'sets_tbl',
+    # Only extracted with SQL_PUSHDOWN=joins (see minifig_etl/pushdown.py)
+    'part_details': 'parts_tbl',
+    'part_relationship_summary': 'parts_tbl',
+    'summarized_inventories': 'inventory_tbl',
+    'inventory_sets_master': 'sets_tbl',
+}
+
+# Raw tables each output is built from in this configuration
+OUTPUT_INPUTS = {output: transform.output_inputs(output, PREJOINED_EXTRACT) for output in transform.OUTPUT_BUILDERS}
+# Tables of the raw layer: every source table, or with pushdown only those an output reads
+if SQL_PUSHDOWN == 'none':
+    RAW_TABLES = [table for table in RAW_TABLE_CATEGORIES if table not in transform.PREJOINED_INPUTS]
+else:
+    RAW_TABLES = [table for table in RAW_TABLE_CATEGORIES if any(table in inputs for inputs in OUTPUT_INPUTS.values())]
+if validation.DATA_VALIDATION == 'quarantine':
+    # The reference checks decide which rows are dropped, so their parent tables are inputs too:
+    # the transform cache fingerprints them and the per-table DAG extracts them before the build
+    OUTPUT_INPUTS = {output: validation.with_reference_parents(inputs, RAW_TABLES) for output, inputs in OUTPUT_INPUTS.items()}
+
+## Per-table DAG layout (DAG_TASK_GRANULARITY='table')
+def extract_task_id(table):
+    """Task that writes a raw table (minifigs come from the API, every other table from the source database)"""
+    return "ingest_data_from_api" if table == 'minifigs' else f"extract_{table}"
+
+def transform_task_outputs():
+    """Transform task name -> the outputs it builds; the sharded build makes dimension_parts and ft_inv_parts in one pass"""
+    groups = {output: [output] for output in transform.OUTPUT_BUILDERS}
+    if SHARDED_BUILD:
+        for output in transform_sharded.SHARDED_OUTPUTS:
+            del groups[output]
+        groups['inventory_parts'] = list(transform_sharded.SHARDED_OUTPUTS)
+    return groups
+
+def transform_task_id(name):
+    return f"build_and_load_{name}" if TRANSFORM_LOAD_MODE == 'fused' else f"build_{name}"
+
+# Tasks the branch runs when ingestion is needed, and when it is skipped
+if DAG_TASK_GRANULARITY == 'table':
+    INGEST_TASK_IDS = [extract_task_id(table) for table in RAW_TABLES]
+    SKIP_INGEST_TASK_IDS = [transform_task_id(name) for name in transform_task_outputs()]
+else:
+    INGEST_TASK_IDS = ["ingest_data_from_sql_db", "ingest_data_from_api"]
+    SKIP_INGEST_TASK_IDS = TRANSFORM_TASK_ID
+
 ## Check if the ingested files already exist. If yes, skip re-ingesting
 def check_staging_files():
     """Check if staging files already exist."""
-    staging_files = [
-        './data/raw/inventory_tbl/inventories.csv',
-        './data/raw/inventory_tbl/inventory_minifigs.csv',
-        './data/raw/inventory_tbl/inventory_parts.csv',
-        './data/raw/inventory_tbl/inventory_sets.csv',
-        './data/raw/rebrickable_minifigs/minifigs.csv',
-        './data/raw/parts_tbl/colors.csv',
-        './data/raw/parts_tbl/elements.csv',
-        './data/raw/parts_tbl/part_categories.csv',
-        './data/raw/parts_tbl/part_relationships.csv',
-        './data/raw/parts_tbl/parts.csv',
-        './data/raw/sets_tbl/sets.csv',
-        './data/raw/sets_tbl/themes.csv'
-    ]
-    
-    for file in staging_files:
-        if not os.path.exists(file):
-            print(f"Staging file {file} does not exist. Ingestion is required.")
-            return ["ingest_data_from_sql_db", "ingest_data_from_api"]  # Run ingestion tasks
+    # Incremental runs are cheap, so always refresh the raw layer
+    if SQL_INGEST_MODE == 'incremental':
+        print("Incremental ingestion enabled. Pulling changes since the last run.")
+        return INGEST_TASK_IDS
+
+    for table in RAW_TABLES:
+        category = RAW_TABLE_CATEGORIES[table]
+        if not storage.table_exists(os.path.join('./data/raw', category), table):
+            print(f"Staging file {storage.table_path(os.path.join('./data/raw', category), table)} does not exist. Ingestion is required.")
+            return INGEST_TASK_IDS  # Run ingestion tasks
     
     print("All staging files exist. Skipping ingestion.")
-    return "Transformed_ingested_data"  # Skip ingestion and run transformation directly
+    return SKIP_INGEST_TASK_IDS  # Skip ingestion and run transformation directly
 
-# Ingest data from sql database
-def ingest_sql_source():
-    """Ingesting data from SQL Server database"""
+# Stream a query result to disk without holding the whole table in memory
+def stream_query_to_file(engine, query, folder, table, append=False, chunk_size=SQL_EXTRACT_CHUNK_SIZE, validator=None):
+    """Write a query result to the raw layer through a server-side (named) psycopg2 cursor, one chunk at a time"""
+    raw_conn = engine.raw_connection()
+    total_rows = 0
+
+    try:
+        # A named cursor keeps the result set on the server; only `chunk_size` rows travel per round trip
+        cursor = raw_conn.cursor(name=f"extract_{uuid.uuid4().hex}")
+        cursor.itersize = chunk_size
+        cursor.execute(query)
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+
+            # Stop once the cursor is drained; a fresh extraction of an empty table still writes its columns once
+            if not rows and (total_rows or append):
+                break
+
+            # Append the chunk to the output (a new row group / part file for Parquet and Arrow)
+            columns = [col[0] for col in cursor.description]
+            chunk = pd.DataFrame.from_records(rows, columns=columns)
+            if validator is not None:
+                chunk = validator.check(chunk)
+            storage.write_table(chunk, folder, table, append=append or total_rows > 0)
+            total_rows += len(rows)
+
+            if not rows:
+                break
+
+        cursor.close()
+        raw_conn.commit()  # Named cursors live inside a transaction
+
+    finally:
+        raw_conn.close()
+
+    return total_rows
+
+# Bulk-export a query result with COPY
+def copy_query_to_file(engine, query, folder, table, append=False, validator=None):
+    """Write a query result with COPY ... TO STDOUT; Postgres formats the rows, no per-row Python objects"""
+    # COPY emits CSV; for columnar storage it goes to a scratch file that is converted chunk by chunk
+    is_csv = storage.STORAGE_FORMAT == 'csv'
+    csv_path = storage.table_path(folder, table) if is_csv else os.path.join(folder, f".{table}.copy.csv")
+    write_header = not (is_csv and append and os.path.exists(csv_path))
+    raw_conn = engine.raw_connection()
+
+    try:
+        with raw_conn.cursor() as cursor, open(csv_path, 'w' if write_header else 'a', newline='') as csv_file:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER {str(write_header).lower()})", csv_file)
+            row_count = cursor.rowcount
+        raw_conn.commit()
+
+    finally:
+        raw_conn.close()
+
+    if not is_csv:
+        # The conversion pass is also where chunks are validated (CSV storage keeps Postgres's file as is)
+        # Typed from the table schema, so a chunk's inferred types cannot differ from the other chunks'
+        dtypes = storage.csv_dtypes(table, pd.read_csv(csv_path, nrows=0).columns)
+        chunks = pd.read_csv(csv_path, chunksize=SQL_EXTRACT_CHUNK_SIZE, dtype=dtypes, true_values=['t'], false_values=['f'])
+        for i, chunk in enumerate(chunks):
+            if validator is not None:
+                chunk = validator.check(chunk)
+            storage.write_table(chunk, folder, table, append=append or i > 0)
+        os.remove(csv_path)
+
+    return row_count
+
+# Extract a query result to the raw layer with the configured extraction mode
+def extract_query(engine, query, folder, table, append=False, validator=None):
+    """Write (or append) a query result as `table` in `folder` using SQL_EXTRACT_MODE and return the rows extracted"""
+    if SQL_EXTRACT_MODE == 'stream':
+        # Page through a server-side cursor and append each chunk
+        return stream_query_to_file(engine, query, folder, table, append, validator=validator)
+
+    if SQL_EXTRACT_MODE == 'copy':
+        # Let Postgres serialise the rows
+        return copy_query_to_file(engine, query, folder, table, append, validator=validator)
+
+    # Read table data into a DataFrame
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn)
+    row_count = len(df)
+    if validator is not None:
+        df = validator.check_table(df, SQL_EXTRACT_CHUNK_SIZE)
+
+    # Save the DataFrame in the configured storage format
+    storage.write_table(df, folder, table, append=append)
+    return row_count
+
+# Query that extracts a raw table from the source database
+def source_query(table):
+    """SELECT * by default; with SQL_PUSHDOWN only the needed columns, or the pre-joined dataset's own query"""
+    if table in pushdown.PREJOINED_QUERIES:
+        return pushdown.PREJOINED_QUERIES[table]
+    if SQL_PUSHDOWN != 'none':
+        return pushdown.select_query(table)
+    return f"SELECT * FROM {table}"
+
+## Incremental ingestion state (one watermark per source table)
+def load_watermarks():
+    """Read the stored per-table watermarks (empty on the first incremental run)"""
+    if not os.path.exists(WATERMARK_STATE_FILE):
+        return {}
+
+    with open(WATERMARK_STATE_FILE) as state_file:
+        return json.load(state_file)
+
+def save_watermark(watermarks, table, value):
+    """Record the new watermark for `table` and persist the state file atomically"""
+    with _watermark_lock, storage.file_lock(WATERMARK_STATE_FILE):
+        watermarks[table] = value
+        # Per-table tasks run in separate processes, so merge into the file rather than overwrite their watermarks
+        stored = load_watermarks()
+        stored[table] = value
+
+        # Write to a temp file first so a crash never leaves a truncated state file
+        tmp_path = f"{WATERMARK_STATE_FILE}.tmp"
+        with open(tmp_path, 'w') as state_file:
+            json.dump(stored, state_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, WATERMARK_STATE_FILE)
+
+def _sql_literal(value):
+    """Quote a watermark value as a SQL string literal; Postgres casts it to the column type"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+# Order-independent hash of one row of `t`, computed in the source database; a set of rows is summarised as
+# '<row count>:<sum of row hashes>'
+_ROW_HASH = "('x' || substr(md5(t::text), 1, 15))::bit(60)::bigint"
+
+# Extract only new or changed rows of a table
+def extract_table_incremental(engine, table, folder, watermarks, validator=None):
+    """Extract the rows of `table` added since its stored watermark onto the raw layer (or all of it, when older rows changed)"""
+    strategy = INCREMENTAL_STRATEGIES.get(table, {})
+    stored = watermarks.get(table)
+    has_raw_file = storage.table_exists(folder, table)
+
+    if 'watermark' in strategy:
+        column = strategy['watermark']
+        # State is {'watermark': max value, 'history': hash of the rows at or below it} (a bare value before the history was kept)
+        previous, previous_history = (stored.get('watermark'), stored.get('history')) if isinstance(stored, dict) else (stored, None)
+        seen = f"{column} <= {_sql_literal(previous)}" if previous is not None else "false"
+
+        # One scan gives the new watermark, the hash of the rows already extracted and the hash to store for the next run
+        with engine.connect() as conn:
+            current, history, current_history = conn.execute(text(
+                f"SELECT max({column})::text, "
+                f"count(*) FILTER (WHERE {seen}) || ':' || coalesce(sum(row_hash) FILTER (WHERE {seen}), 0), "
+                f"count(*) || ':' || coalesce(sum(row_hash), 0) "
+                f"FROM (SELECT t.{column}, {_ROW_HASH} AS row_hash FROM {table} t WHERE t.{column} IS NOT NULL) hashed"
+            )).one()
+
+        # Rows changed or deleted under an already-seen watermark: the appended deltas no longer match the source
+        reconciled = previous_history is None or history == previous_history
+        if not reconciled:
+            print(f"{table}: rows at or below {column}={previous} changed since the last run, re-extracting in full")
+
+        if has_raw_file and previous is not None and current == previous and reconciled:
+            print(f"{table}: no rows past watermark {column}={previous}, skipping")
+            return 0
+
+        # Bound the read by the current max so rows committed during extraction are picked up next run
+        conditions = [f"{column} <= {_sql_literal(current)}"] if current is not None else []
+        is_delta = has_raw_file and previous is not None and current is not None and reconciled
+        if is_delta:
+            conditions.append(f"{column} > {_sql_literal(previous)}")
+        query = source_query(table) + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+
+        if is_delta:
+            # New rows go straight onto the end of the raw table
+            row_count = extract_query(engine, query, folder, table, append=True, validator=validator)
+            print(f"{table}: appended {row_count} new rows ({column} > {previous})")
+        else:
+            row_count = extract_query(engine, query, folder, table, validator=validator)
+            print(f"{table}: full load of {row_count} rows")
+        state = {'watermark': current, 'history': current_history}
+
+    else:
+        # No usable watermark column: compare an order-independent content hash computed in the source database
+        with engine.connect() as conn:
+            current = conn.execute(text(f"SELECT count(*) || ':' || coalesce(sum({_ROW_HASH}), 0) FROM {table} t")).scalar()
+
+        if has_raw_file and current == stored:
+            print(f"{table}: content hash unchanged, skipping")
+            return 0
+
+        row_count = extract_query(engine, source_query(table), folder, table, validator=validator)
+        print(f"{table}: content changed, re-extracted {row_count} rows")
+        state = current
+
+    save_watermark(watermarks, table, state)
+    return row_count
 
+# Extract a single source table into its category subfolder
+def extract_table(engine, table, category, data_folder, watermarks=None):
+    """Dump one source table to the raw layer on its own pooled connection and return the elapsed time in seconds"""
+    start_time = time.perf_counter()
+    print(f"Fetching data from {table} in category {category}...")
+
+    # Define the subfolder path based on the category
+    category_folder = os.path.join(data_folder, category)
+    os.makedirs(category_folder, exist_ok=True)  # Create subfolder if it doesn't exist (safe across threads)
+
+    # Checks run on each chunk before it is written (parent tables may still be extracting, so no references here)
+    validator = validation.Validator(table, 'extract') if validation.enabled() else None
+
+    with instrumentation.span('extract', table=table, mode=SQL_EXTRACT_MODE, incremental=watermarks is not None) as step:
+        if watermarks is not None and table not in pushdown.PREJOINED_QUERIES:
+            # Incremental mode: only rows past the stored watermark are pulled (pre-joined datasets are small and always rebuilt)
+            row_count = extract_table_incremental(engine, table, category_folder, watermarks, validator)
+        else:
+            # Query to select all (or, with pushdown, the needed) data from the table
+            row_count = extract_query(engine, source_query(table), category_folder, table, validator=validator)
+            print(f"Data from {table} saved to {storage.table_path(category_folder, table)} ({row_count} rows)")
+        step.add(rows_out=row_count, bytes_written=instrumentation.path_size(storage.table_path(category_folder, table)))
+        if validator is not None:
+            validator.finish()
+
+    # Reference tables go into the lookup store as they land, so transform tasks read them without decoding (LOOKUP_STORE)
+    lookup_store.publish(category_folder, table)
+
+    return time.perf_counter() - start_time
+
+def source_engine(pool_size):
+    """SQLAlchemy engine for the source PostgreSQL DB with `pool_size` pooled connections"""
     # Fetching the source environment variables
     DB_USER = os.getenv("POSTGRES_USER")
     DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
@@ -53,15 +403,21 @@ def ingest_sql_source():
     DB_CONN_STRING = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
     print(f"Connection string: {DB_CONN_STRING}")
 
+    return create_engine(DB_CONN_STRING, pool_size=pool_size, max_overflow=0)
+
+# Ingest data from sql database
+@instrumentation.task('ingest_sql')
+def ingest_sql_source():
+    """Ingesting data from SQL Server database"""
     try:
-        # Creating a SQLAlchemy engine
-        engine = create_engine(DB_CONN_STRING)
+        # Creating a SQLAlchemy engine with one pooled connection per extraction worker
+        engine = source_engine(SQL_EXTRACT_WORKERS)
         
         # Test the connection
         with engine.connect() as conn:
             print("Connection to PostgreSQL database successful.")
             
-            # Query to fetch data from inventories table
+            # Query to fetch the source tables, largest first so the slowest extraction starts immediately
             category_query = """
             select * from (
                 select 
@@ -71,49 +427,55 @@ def ingest_sql_source():
                         when table_name in ('parts', 'part_relationships', 'part_categories', 'colors', 'elements') then 'parts_tbl'
                         when table_name in ('sets', 'themes') then 'sets_tbl'
                         else ''
-                    end as "table_category"
+                    end as "table_category",
+                    pg_total_relation_size(quote_ident(table_schema) || '.' || quote_ident(table_name)) as "table_size"
                 from information_schema.tables where table_type = 'BASE TABLE'
                 ) subQ
             where table_category != ''
+            order by table_size desc
             """
             
             # Reading the data into a DataFrame
             tables = pd.read_sql(category_query, conn)
 
-            # Define the path to the raw data folder
-            data_folder = './data/raw'
-            if not os.path.exists(data_folder):
-                os.makedirs(data_folder)  # Create directory if it doesn't exist
-
-            # Loop through each table, create category subfolder, and dump data
-            for _, row in tables.iterrows():
-                table = row['table_name']
-                category = row['table_category']
-
-                print(f"Fetching data from {table} in category {category}...")
-
-                # Define the subfolder path based on the category
-                category_folder = os.path.join(data_folder, category)
-                if not os.path.exists(category_folder):
-                    os.makedirs(category_folder)  # Create subfolder if it doesn't exist
-
+        if SQL_PUSHDOWN != 'none':
+            # Only the tables an output reads, then the datasets Postgres pre-joins
+            prejoined = [table for table in RAW_TABLES if table in pushdown.PREJOINED_QUERIES]
+            tables = pd.concat([
+                tables[tables['table_name'].isin(RAW_TABLES)],
+                pd.DataFrame({'table_name': prejoined, 'table_category': [RAW_TABLE_CATEGORIES[table] for table in prejoined]}),
+            ], ignore_index=True)
+
+        # Define the path to the raw data folder
+        data_folder = './data/raw'
+        if not os.path.exists(data_folder):
+            os.makedirs(data_folder)  # Create directory if it doesn't exist
+
+        # Watermarks are only tracked in incremental mode
+        watermarks = load_watermarks() if SQL_INGEST_MODE == 'incremental' else None
+
+        # Extract the tables concurrently; each worker checks out its own connection from the pool
+        total_start = time.perf_counter()
+        table_timings = {}
+        with ThreadPoolExecutor(max_workers=SQL_EXTRACT_WORKERS) as executor:
+            futures = {
+                executor.submit(extract_table, engine, row['table_name'], row['table_category'], data_folder, watermarks): row['table_name']
+                for _, row in tables.iterrows()
+            }
+
+            for future in as_completed(futures):
+                table = futures[future]
                 try:
-                    # Query to select all data from the table
-                    query = f"SELECT * FROM {table}"
-
-                    # Read table data into a DataFrame
-                    df = pd.read_sql(query, engine)
-
-                    # Define the file path for the table's CSV file inside the category subfolder
-                    csv_path = os.path.join(category_folder, f"{table}.csv")
-
-                    # Save the DataFrame to CSV
-                    df.to_csv(csv_path, index=False)
-                    print(f"Data from {table} saved to {csv_path}")
-
+                    table_timings[table] = future.result()
                 except Exception as e:
                     print(f"Error processing table {table}: {e}")
 
+        # Report time per table and overall wall-clock time
+        for table, elapsed in sorted(table_timings.items(), key=lambda item: item[1], reverse=True):
+            print(f"{table}: {elapsed:.2f}s")
+        print(f"Extracted {len(table_timings)} tables in {time.perf_counter() - total_start:.2f}s "
+              f"with {SQL_EXTRACT_WORKERS} workers")
+
     except Exception as e:
         print(f"Error: Unable to connect to the database. {e}")
 
@@ -125,9 +487,22 @@ def ingest_sql_source():
 
     print("Data ingestion complete!")
 
+# Ingest a single table from the sql database (per-table DAG layout)
+@instrumentation.task('ingest_sql_table')
+def ingest_sql_table(table):
+    """Extract one source table; errors fail the task, so an Airflow retry re-extracts only this table"""
+    engine = source_engine(1)
+    try:
+        watermarks = load_watermarks() if SQL_INGEST_MODE == 'incremental' else None
+        elapsed = extract_table(engine, table, RAW_TABLE_CATEGORIES[table], './data/raw', watermarks)
+        print(f"Extracted {table} in {elapsed:.2f}s")
+    finally:
+        engine.dispose()
+
 # Ingest data from Rebrickable API
+@instrumentation.task('ingest_api')
 def ingest_api_data():
-    """Ingesting data from Rebrickable REST API and saving it as CSV in the data folder in project root"""
+    """Ingesting data from Rebrickable REST API and saving it to the raw data folder in project root"""
 
     # Retrieve environment variables for API URL and key
     api_url = os.getenv('API_URL')
@@ -137,80 +512,106 @@ def ingest_api_data():
     print(f"API URL: {api_url}")
     print(f"API Key: {api_key}")
     
-    # Define headers with API key
-    headers = {
-        "Authorization": f"key {api_key}"
-    }
+    # Define the path to the raw data folder
+    data_folder = './data/raw'
+    subfolder = 'rebrickable_minifigs'
+
+    # Create the sub-folder if it doesn't exist
+    subfolder_path = os.path.join(data_folder, subfolder)
+    if not os.path.exists(subfolder_path):
+        os.makedirs(subfolder_path)  # Create directory if it doesn't exist
+
+    # Pages are streamed to disk as they arrive; the checkpoint lets a retried task resume where the last attempt stopped
+    page_store = api_client.PageStore(os.path.join(subfolder_path, '_pages'), api_url, API_FETCH_MODE)
+
+    # Rows, bytes and rate-limit waits of the fetch are recorded on one span
+    with instrumentation.span('api_fetch', mode=API_FETCH_MODE) as fetch:
+        if API_FETCH_MODE == 'async':
+            # Concurrent page fetches behind a token-bucket rate limiter
+            api_client.fetch_pages_to_store(api_url, api_key, page_store)
+        else:
+            # Define headers with API key
+            headers = {
+                "Authorization": f"key {api_key}"
+            }
     
-    all_data = []  # List to store all records
-    next_page_url = api_url  # Start with the initial API URL
-    delay_time = 1  # Set delay time (in seconds)
+            next_page_url = page_store.state["next_url"]  # Start with the initial API URL (or where the last attempt stopped)
+            page_number = len(page_store.state["completed_pages"]) + 1
+            fetched_records = 0
+            delay_time = 1  # Set delay time (in seconds)
     
-    while next_page_url:
-        response = requests.get(next_page_url, headers=headers)
+            while next_page_url:
+                response = requests.get(next_page_url, headers=headers)
         
-        # Log the response status for debugging
-        print(f"Response Status: {response.status_code}")
+                # Log the response status for debugging
+                print(f"Response Status: {response.status_code}")
         
-        if response.status_code == 200:
-            data = response.json()  # Convert API response to JSON
-            
-            # Append records to all_data list
-            if "results" in data:
-                all_data.extend(data["results"])  # Add new records
-                
-            # Check if there is a next page
-            next_page_url = data.get("next")  # Get next page URL (if available)
+                if response.status_code == 200:
+                    data = response.json()  # Convert API response to JSON
+                    results = data.get("results", [])
+
+                    # Check if there is a next page
+                    next_page_url = data.get("next")  # Get next page URL (if available)
+
+                    # Write the page and checkpoint the next URL before moving on
+                    page_store.save_page(page_number, results, next_page_url)
+                    page_number += 1
+                    fetched_records += len(results)
+                    fetch.add(pages=1, rows_out=len(results), bytes_read=len(response.content))
             
-            print(f"Fetched {len(all_data)} records so far...")  # Debugging output
+                    print(f"Fetched {fetched_records} records so far...")  # Debugging output
     
-            # Add delay before the next request
-            time.sleep(delay_time)
+                    # Add delay before the next request
+                    time.sleep(delay_time)
+                    fetch.add(rate_limit_wait_s=delay_time)
     
-        elif response.status_code == 429:
-            # API rate limit hit: Wait and retry
-            retry_after = int(response.headers.get("Retry-After", delay_time))
-            print(f"Rate limit exceeded! Waiting for {retry_after} seconds before retrying...")
-            time.sleep(retry_after)
+                elif response.status_code == 429:
+                    # API rate limit hit: Wait and retry
+                    retry_after = int(response.headers.get("Retry-After", delay_time))
+                    print(f"Rate limit exceeded! Waiting for {retry_after} seconds before retrying...")
+                    time.sleep(retry_after)
+                    fetch.add(rate_limit_wait_s=retry_after)
             
-        else:
-            print(f"Failed to fetch data: {response.status_code}, {response.text}")
-            break  # Stop if there's an error
+                else:
+                    # Fail the task so the Airflow retry resumes from the checkpoint instead of saving a partial catalogue
+                    raise RuntimeError(f"Failed to fetch data: {response.status_code}, {response.text}")
+
+    # Consolidate the page segments into the raw table, one page in memory at a time
+    total_records = 0
+    validator = validation.Validator('minifigs', 'extract') if validation.enabled() else None
+    with instrumentation.span('write', table='minifigs', layer='raw') as step:
+        for page_records in page_store.iter_pages():
+            if not page_records:
+                continue
+            page_df = pd.DataFrame(page_records)
+            if validator is not None:
+                page_df = validator.check(page_df)
+            output_path = storage.write_table(page_df, subfolder_path, "minifigs", append=total_records > 0)
+            total_records += len(page_records)
+        step.add(rows_out=total_records, bytes_written=instrumentation.path_size(storage.table_path(subfolder_path, "minifigs")))
+        if validator is not None:
+            validator.finish()
+
+    # The raw table is complete, so the segments and checkpoint are no longer needed
+    page_store.clear()
 
     # After fetching all the data, check if any records were fetched
-    if not all_data:
+    if not total_records:
         print("❌ No data fetched from API.")
         return
-    
-    # Convert list to DataFrame
-    df = pd.DataFrame(all_data)
-    
-    # Debugging: Print the first few rows of the DataFrame
-    print(f"DataFrame Head:\n{df.head()}")
-    
-    # Define the path to the raw data folder
-    data_folder = './data/raw'
-    subfolder = 'rebrickable_minifigs'
 
-    if not os.path.exists(data_folder):
-        os.makedirs(data_folder)  # Create directory if it doesn't exist
+    print(f"{total_records} records saved to {output_path}")
 
-    # Create the sub-folder if it doesn't exist
-    subfolder_path = os.path.join(data_folder, subfolder)
-    if not os.path.exists(subfolder_path):
-        os.makedirs(subfolder_path)  # Create directory if it doesn't exist
-    
-    # Define the full CSV path
-    csv_path = os.path.join(subfolder_path, "minifigs.csv")
-    
-    # Save the DataFrame as CSV
-    df.to_csv(csv_path, index=False)
-    
-    print(f"Data saved to {csv_path}")
 
+@instrumentation.task('transform')
+def transforming_data(handoff=None, outputs=None):
+    """Load raw data, perform transformations, create dimensional modeling tables, and save them to './data/transformed'.
 
-def transforming_data():
-    """Load raw data, perform transformations, create dimensional modeling tables, and save them to './data/transformed'."""
+    With `handoff`, each table is also passed to `handoff(output, df)` as soon as it is ready (tables the cache
+    skips are read back from disk), and saving to disk follows KEEP_TRANSFORMED_FILES.
+    `outputs` limits the run to those output tables (default: all of them).
+    """
+    save_files = handoff is None or KEEP_TRANSFORMED_FILES
     # Define the path to the raw data folder
     raw_data_dir = './data/raw'
     transformed_dir = './data/transformed'
@@ -219,143 +620,133 @@ def transforming_data():
     if not os.path.exists(transformed_dir):
         os.makedirs(transformed_dir)  # Create directory if it doesn't exist
 
-    # Find all .csv files in the raw folder and its subfolders
-    csv_files = glob.glob(os.path.join(raw_data_dir, '**/*.csv'), recursive=True)
-
-    # Print the list of found files
-    print(f"Found {len(csv_files)} CSV files:")
-    for file in csv_files:
-        print(file)
-
-    # Dictionary to store DataFrames
-    dataframes = {}
-
-    # Load each CSV file into a DataFrame
-    for file in csv_files:
-        # Extract the file name (without extension) and subfolder name
-        relative_path = os.path.relpath(file, raw_data_dir)
-        key = os.path.splitext(relative_path)[0]  # Remove .csv extension
-        key = key.replace(os.path.sep, '_')  # Replace slashes with underscores
-
-        # Load the CSV file into a DataFrame
-        df = pd.read_csv(file)
-        dataframes[key] = df
-
-        print(f"Loaded {file} into DataFrame with key: {key}")
-
-    # Extract individual DataFrames
-    inventory_parts_df = dataframes['inventory_tbl_inventory_parts']
-    part_relationship_df = dataframes['parts_tbl_part_relationships']
-    colors_df = dataframes['parts_tbl_colors']
-    parts_df = dataframes['parts_tbl_parts']
-    part_categories_df = dataframes['parts_tbl_part_categories']
-    sets_df = dataframes['sets_tbl_sets']
-    themes_df = dataframes['sets_tbl_themes']
-    inventories_df = dataframes['inventory_tbl_inventories']
-    inventory_minifigs_df = dataframes['inventory_tbl_inventory_minifigs']
-    minifigs_df = dataframes['rebrickable_minifigs_minifigs']
-    inventory_sets_df = dataframes['inventory_tbl_inventory_sets']
-
-    # Step 1: Aggregate part_relationships
-    rel_type_mapping = {
-        'P': 'Print',
-        'R': 'Pair',
-        'B': 'Sub-Part',
-        'M': 'Mold',
-        'T': 'Pattern',
-        'A': 'Alternative'
-    }
-
-    # Combine both operations into one
-    _summarized_part_relationship = (
-        part_relationship_df
-        # Add rel_type_desc based on rel_type
-        .assign(rel_type_desc=lambda x: x['rel_type'].map(rel_type_mapping))
-        # Group by parent_part_num and rel_type
-        .groupby(['parent_part_num', 'rel_type', 'rel_type_desc'])
-        .size()
-        .reset_index(name='counting')
-        # Group by parent_part_num and aggregate rel_type and rel_type_desc
-        .groupby('parent_part_num')
-        .agg({
-            'rel_type': lambda x: ', '.join(x),
-            'rel_type_desc': lambda x: ', '.join(x)
+    # Checks for a raw table as the transform reads it; parent tables are loaded (and checked) first for the reference checks.
+    # Only inputs of the outputs being built serve as parents (with quarantine, OUTPUT_INPUTS holds every parent)
+    def raw_validator(table):
+        if not validation.enabled():
+            return None
+        inputs = {input_table for output in outputs for input_table in OUTPUT_INPUTS[output]}
+        references = validation.TABLE_RULES.get(table, {}).get('references', {}).values()
+        return validation.Validator(table, 'transform', {parent: raw[parent] for parent, _ in references if parent in inputs and parent in raw})
+
+    # Load a raw table into a DataFrame (typed by the storage layer's per-table schemas)
+    def load_raw_table(table):
+        category_folder = os.path.join(raw_data_dir, RAW_TABLE_CATEGORIES[table])
+        validator = raw_validator(table)
+        with instrumentation.span('read', table=table, layer='raw') as step:
+            df = lookup_store.read_table(category_folder, table)
+            step.add(rows_out=len(df), bytes_read=instrumentation.path_size(storage.table_path(category_folder, table)))
+            if validator is not None:
+                # Checked in extraction-sized chunks, so a null-rate breach quarantines a chunk and not the table
+                df = validator.check_table(df, SQL_EXTRACT_CHUNK_SIZE)
+                validator.finish()
+        print(f"Loaded {storage.table_path(category_folder, table)} into DataFrame with key: {RAW_TABLE_CATEGORIES[table]}_{table}")
+        return df
+
+    requested = list(outputs or transform.OUTPUT_BUILDERS)
+    outputs = requested
+    manifest, fingerprints, version = {}, {}, None
+
+    if TRANSFORM_CACHE:
+        # Fingerprint every raw table an output depends on and rebuild only outputs whose inputs or code changed
+        input_tables = sorted({table for output in requested for table in OUTPUT_INPUTS[output]})
+        fingerprints = {
+            table: transform_cache.fingerprint_path(storage.table_path(os.path.join(raw_data_dir, RAW_TABLE_CATEGORIES[table]), table))
+            for table in input_tables
+        }
+        version = transform_cache.code_version(TRANSFORM_ENGINE)
+        manifest = transform_cache.load_manifest()
+        outputs = transform_cache.stale_outputs(manifest, fingerprints, version, transformed_dir, {output: OUTPUT_INPUTS[output] for output in requested})
+
+        # Unchanged tables are already on disk and go to the loader first
+        if handoff is not None:
+            for output in requested:
+                if output not in outputs:
+                    for table in surrogate_keys.output_tables(output):
+                        handoff(table, lookup_store.read_table(transformed_dir, table))
+
+        if not outputs:
+            print("Raw inputs and transform code unchanged. Skipping transformation.")
+            return
+        print(f"Rebuilding {len(outputs)} of {len(requested)} tables: {', '.join(outputs)}")
+
+    if TRANSFORM_ENGINE == 'duckdb':
+        # Lazy SQL over the raw files: projection pushdown, multi-threaded joins and spilling to disk
+        from minifig_etl import transform_duckdb
+        input_tables = {table for output in outputs for table in OUTPUT_INPUTS[output]}
+        raw = transform_duckdb.RawViews({
+            table: storage.table_path(os.path.join(raw_data_dir, RAW_TABLE_CATEGORIES[table]), table)
+            for table in input_tables
         })
-        .reset_index()
-    )
-
-    ## inventories merged with sets and themes
-    __summarizedinventories_df = (
-        inventories_df.rename(columns={'id': 'inventory_id'})
-        .merge(sets_df, how='left', on='set_num').rename(columns={'name': 'set_name', 'set_num': 'setnum', 'img_url': 'set_img_url', 'num_parts': 'numparts'})
-        .merge(themes_df, how='left', left_on='theme_id', right_on='id').rename(columns={'id': 'themesid', 'name': 'themes_name'})
-    )
-
-    # Master dataset for inventory parts
-    inventory_parts_master = (
-        inventory_parts_df
-        # .merge(__summarizedinventories_df, how='left', on='inventory_id')   # No direct relationship between these two
-        .merge(parts_df, how='left', on='part_num').rename(columns={'part_num': 'part_num_id', 'name': 'part_name'})
-        .merge(part_categories_df, how='left', left_on='part_cat_id', right_on='id').rename(columns={'id': 'part_categories_id', 'name': 'part_category_name'})
-        .merge(colors_df, how='left', left_on='color_id', right_on='id')
-        .merge(_summarized_part_relationship, how='left', left_on='part_num_id', right_on='parent_part_num')
-    )
-
-    # Master dataset for inventory minifigs
-    inventory_minifigs_master = (
-        inventory_minifigs_df
-        .merge(minifigs_df, how='left', left_on='fig_num', right_on='set_num')
-        .merge(__summarizedinventories_df, how='left', on='inventory_id')
-    )
-
-    # Change last_modified_dt from object to Timestamp
-    inventory_minifigs_master['last_modified_dt'] = pd.to_datetime(inventory_minifigs_master['last_modified_dt'])
-
-    # Master dataset for inventory sets
-    inventory_sets_master = (
-        inventory_sets_df
-        .merge(sets_df, how='left', on='set_num').rename(columns={'name': 'set_name', 'set_num': 'setnum', 'img_url': 'set_img_url', 'num_parts': 'numparts'})
-        .merge(themes_df, how='left', left_on='theme_id', right_on='id').rename(columns={'id': 'themesid', 'name': 'themes_name'})
-    )
-
-    ## Setting up Dimensional modeling (facts/dimension tables)
-    # Dimension Sets table
-    dimension_sets = sets_df[['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url']] \
-        .rename(columns={'set_num': 'setNum', 'name': 'setName', 'theme_id': 'themeId', 'num_parts': 'numParts', 'img_url': 'imageUrl'})
-
-    # Dimension Colors table
-    dimension_colors = colors_df[['id', 'name', 'rgb', 'is_trans', 'num_parts', 'num_sets', 'y1', 'y2']] \
-        .rename(columns={'id': 'colorId', 'name': 'colorName', 'is_trans': 'isTransparent', 'num_parts': 'numParts', 'num_sets': 'numSets', 'y1': 'year1', 'y2': 'year2'}) \
-        .drop_duplicates(subset='colorId')
-
-    # Dimension Parts table
-    dimension_parts = inventory_parts_master[['part_name', 'part_num_id', 'part_cat_id', 'part_category_name', 'part_material', 'rel_type', 'rel_type_desc']] \
-        .rename(columns={'part_name': 'partName', 'part_num_id': 'partNumber', 'part_cat_id': 'partCategoryId', 'part_category_name': 'partCategoryName', 'part_material': 'partMaterial', \
-            'rel_type': 'relationshipType', 'rel_type_desc': 'relationshipTypeDesc'}) \
-        .drop_duplicates()
-
-    # Facts inventory minifigs
-    ft_inv_minifigs = inventory_minifigs_master[['inventory_id', 'fig_num', 'quantity', 'set_num', 'set_url', 'last_modified_dt']].rename(columns={'last_modified_dt': 'last_modified'})
-
-    # Facts inventory sets
-    ft_inv_sets = inventory_sets_master[['inventory_id', 'setnum', 'numparts', 'set_img_url', 'quantity']].rename(columns={'numparts': 'num_parts'})
-
-    # Facts inventory parts
-    ft_inv_parts = inventory_parts_master[['inventory_id', 'part_num_id', 'color_id', 'quantity', 'is_spare', 'img_url']]
-
-    # Save the DataFrames to the transformed folder
-    dimension_sets.to_csv(os.path.join(transformed_dir, 'dimension_sets.csv'), index=False)
-    dimension_colors.to_csv(os.path.join(transformed_dir, 'dimension_colors.csv'), index=False)
-    dimension_parts.to_csv(os.path.join(transformed_dir, 'dimension_parts.csv'), index=False)
-    ft_inv_minifigs.to_csv(os.path.join(transformed_dir, 'ft_inv_minifigs.csv'), index=False)
-    ft_inv_sets.to_csv(os.path.join(transformed_dir, 'ft_inv_sets.csv'), index=False)
-    ft_inv_parts.to_csv(os.path.join(transformed_dir, 'ft_inv_parts.csv'), index=False)
-
-    print(f"All fact and dimension tables saved to {transformed_dir}")
+        builders = transform_duckdb.OUTPUT_BUILDERS
+    else:
+        # Raw tables are only read if a stale output needs them; shared joins are built once
+        raw = transform.RawTables(load_raw_table, RAW_TABLES)
+        # With JOIN_PLANNER the inventory outputs run projected lookup joins (see minifig_etl/join_planner.py)
+        builders = join_planner.output_builders()
+    shared = {}
+    if (TRANSFORM_ENGINE != 'duckdb' and lookup_store.LOOKUP_STORE and validation.DATA_VALIDATION != 'quarantine'
+            and any('part_relationships' in OUTPUT_INPUTS[output] for output in outputs)):
+        # The relationship summary is reused from the lookup store while part_relationships is unchanged
+        # (not with quarantine, where the summary also depends on which rows the checks let through)
+        lookup_store.part_relationship_summary(os.path.join(raw_data_dir, RAW_TABLE_CATEGORIES['part_relationships']), raw, shared)
+    key_store = surrogate_keys.KeyStore() if surrogate_keys.SURROGATE_KEYS else None
+    # inventory_parts outputs built shard by shard in a process pool (see minifig_etl/transform_sharded.py)
+    shard_outputs = transform_sharded.SHARDED_OUTPUTS if SHARDED_BUILD else []
+    sharded = {}
+
+    # Build and save each fact/dimension table to the transformed folder
+    for output in outputs:
+        with instrumentation.span('build', output=output, engine=TRANSFORM_ENGINE) as step:
+            if output in shard_outputs:
+                # One pass over the shards builds both outputs; the workers write ft_inv_parts themselves (None here)
+                if not sharded:
+                    sharded = transform_sharded.build_inventory_parts(
+                        raw, shared, os.path.join(raw_data_dir, RAW_TABLE_CATEGORIES['inventory_parts']), transformed_dir, key_store,
+                        raw_validator('inventory_parts'),
+                    )
+                tables = sharded[output]
+            else:
+                df = builders[output](raw, shared)
+                # Swap natural keys and repeated strings for integer surrogate keys
+                tables = surrogate_keys.compact(output, df, key_store) if key_store else {output: df}
+
+                if TRANSFORM_ENGINE != 'duckdb':
+                    # Raw rows behind this output (DuckDB scans the files itself, so only the pandas engine knows them).
+                    # Only the inputs actually loaded count: indexing `raw` would load the ones the build skipped
+                    # (a stored relationship summary, lookups the join planner dropped)
+                    step.add(rows_in=sum(len(raw.tables[table]) for table in OUTPUT_INPUTS[output] if table in raw.tables))
+            step.add(rows_out=sum(len(table_df) for table_df in tables.values() if table_df is not None))
+
+        for table, table_df in tables.items():
+            if table_df is None:
+                # Already written shard by shard
+                if handoff is not None:
+                    handoff(table, storage.read_table(transformed_dir, table))
+                continue
+            if handoff is not None:
+                handoff(table, table_df)
+            if save_files:
+                with instrumentation.span('write', table=table, layer='transformed') as step:
+                    path = storage.write_table(table_df, transformed_dir, table)
+                    step.add(rows_out=len(table_df), bytes_written=instrumentation.path_size(path))
+                # Dimension tables go into the lookup store for the load task (LOOKUP_STORE)
+                lookup_store.publish(transformed_dir, table, table_df)
+
+        if save_files:
+            if TRANSFORM_CACHE:
+                transform_cache.record_output(manifest, output, OUTPUT_INPUTS[output], fingerprints, version)
+                transform_cache.save_manifest(manifest, [output])
+
+    if TRANSFORM_ENGINE == 'duckdb':
+        raw.close()
+
+    if save_files:
+        print(f"All fact and dimension tables saved to {transformed_dir}")
 
 # Loading transformed data into the Analytics Database (PostgreSQL)
-def load_to_postgres():
-    """Loading transformed data into the destination PostgreSQL DB"""
+def warehouse_engine():
+    """SQLAlchemy engine for the destination PostgreSQL DB"""
     # Fetching the source environment variables
     DB_USER = os.getenv("POSTGRES_USER")
     DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
@@ -366,30 +757,79 @@ def load_to_postgres():
     DB_CONN_STRING = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
     print(f"Connection string: {DB_CONN_STRING}")
 
-    engine = create_engine(DB_CONN_STRING)
-    conn = engine.connect()
+    return create_engine(DB_CONN_STRING)
+
+
+def load_table(engine, table_name, df):
+    """Load one dimension or fact table with the configured load mode"""
+    with instrumentation.span('load', table=table_name, mode=WAREHOUSE_LOAD_MODE) as step:
+        if WAREHOUSE_LOAD_MODE == 'merge':
+            warehouse.merge_frame_into_table(engine, df, table_name)
+        elif WAREHOUSE_LOAD_MODE == 'copy':
+            warehouse.copy_frame_to_table(engine, df, table_name)
+        else:
+            df.to_sql(table_name, con=engine, if_exists='replace', index=False)
+        step.add(rows_in=len(df))
+    print(f"Loaded {len(df)} rows into {table_name}")
+
+
+@instrumentation.task('load')
+def load_to_postgres(tables=None):
+    """Loading transformed data into the destination PostgreSQL DB (`tables` limits it to those transformed tables)"""
+    engine = warehouse_engine()
 
     # Define data path to write transformed data
     transformed_data_folder = './data/transformed'
-    
-    # Read transformed CSVs
-    dimension_sets = pd.read_csv(f"{transformed_data_folder}/dimension_sets.csv")
-    dimension_colors = pd.read_csv(f"{transformed_data_folder}/dimension_colors.csv")
-    dimension_parts = pd.read_csv(f"{transformed_data_folder}/dimension_parts.csv")
-    ft_inv_minifigs = pd.read_csv(f"{transformed_data_folder}/ft_inv_minifigs.csv")
-    ft_inv_sets = pd.read_csv(f"{transformed_data_folder}/ft_inv_sets.csv")
-    ft_inv_parts = pd.read_csv(f"{transformed_data_folder}/ft_inv_parts.csv")
-
-    # Load Dimensions and Fact Tables (Upsert)
-    dimension_sets.to_sql('sets_dim', con=engine, if_exists='replace', index=False)
-    dimension_colors.to_sql('colors_dim', con=engine, if_exists='replace', index=False)
-    dimension_parts.to_sql('parts_dim', con=engine, if_exists='replace', index=False)
-    ft_inv_minifigs.to_sql('inventory_minifigs_ft', con=engine, if_exists='replace', index=False)
-    ft_inv_sets.to_sql('inventory_sets_ft', con=engine, if_exists='replace', index=False)
-    ft_inv_parts.to_sql('inventory_parts_ft', con=engine, if_exists='replace', index=False)
+
+    # Read and load Dimensions and Fact Tables, one at a time
+    for table in tables or surrogate_keys.transformed_tables(transform.OUTPUT_BUILDERS):
+        with instrumentation.span('read', table=table, layer='transformed') as step:
+            df = lookup_store.read_table(transformed_data_folder, table)
+            step.add(rows_out=len(df), bytes_read=instrumentation.path_size(storage.table_path(transformed_data_folder, table)))
+        load_table(engine, WAREHOUSE_TABLES[table], df)
 
     print("Data loaded into PostgreSQL")
-    conn.close()
+
+
+@instrumentation.task('transform_and_load')
+def transform_and_load(outputs=None):
+    """Transform and load in one task: a loader thread writes each table to PostgreSQL while the next one is built"""
+    engine = warehouse_engine()
+    built_tables = queue.Queue(maxsize=TRANSFORM_LOAD_QUEUE_SIZE)
+    load_errors = []
+
+    def loader():
+        while True:
+            item = built_tables.get()
+            if item is None:
+                return
+            if load_errors:
+                continue  # Keep draining so the transform never blocks on a full queue
+            output, df = item
+            try:
+                load_table(engine, WAREHOUSE_TABLES[output], df)
+            except Exception as e:
+                load_errors.append(e)
+
+    def handoff(output, df):
+        # Stop transforming as soon as a load has failed
+        if load_errors:
+            raise load_errors[0]
+        built_tables.put((output, df))
+
+    start = time.perf_counter()
+    loader_thread = threading.Thread(target=loader, name="warehouse-loader")
+    loader_thread.start()
+    try:
+        transforming_data(handoff, outputs)
+    finally:
+        # Tables already handed off are still loaded
+        built_tables.put(None)
+        loader_thread.join()
+
+    if load_errors:
+        raise load_errors[0]
+    print(f"Data transformed and loaded into PostgreSQL in {time.perf_counter() - start:.2f}s")
 
 # Airflow DAG Configuration
 default_args = {
@@ -416,31 +856,85 @@ check_staging_task = BranchPythonOperator(
     dag = dag
 )
 
-# Define Airflow tasks
-ingest_sql_task = PythonOperator(
-    task_id = "ingest_data_from_sql_db",
-    python_callable = ingest_sql_source,
-    dag = dag
-)
-
-ingest_api_task = PythonOperator(
-    task_id = "ingest_data_from_api",
-    python_callable = ingest_api_data,
-    dag = dag
-)
-
-transformed_data_task = PythonOperator(
-    task_id = "Transformed_ingested_data",
-    python_callable = transforming_data,
-    dag = dag
-)
+if DAG_TASK_GRANULARITY == 'table':
+    # One task per source table; a retry re-extracts only that table
+    extract_tasks = {
+        table: PythonOperator(
+            task_id = extract_task_id(table),
+            python_callable = ingest_sql_table,
+            op_kwargs = {'table': table},
+            dag = dag
+        )
+        for table in RAW_TABLES if table != 'minifigs'
+    }
+    extract_tasks['minifigs'] = PythonOperator(
+        task_id = extract_task_id('minifigs'),
+        python_callable = ingest_api_data,
+        dag = dag
+    )
+    check_staging_task >> list(extract_tasks.values())
+
+    # One task per output (or per output group), downstream of only the raw tables it reads
+    for name, outputs in transform_task_outputs().items():
+        transform_task = PythonOperator(
+            task_id = transform_task_id(name),
+            python_callable = transform_and_load if TRANSFORM_LOAD_MODE == 'fused' else transforming_data,
+            op_kwargs = {'outputs': outputs},
+            trigger_rule = "none_failed_min_one_success",   # Runs after its extractions, or straight after the branch when ingestion is skipped
+            dag = dag
+        )
+        input_tables = sorted({table for output in outputs for table in OUTPUT_INPUTS[output]})
+        [extract_tasks[table] for table in input_tables] >> transform_task
+        check_staging_task >> transform_task
+
+        if TRANSFORM_LOAD_MODE != 'fused':
+            # One load task per warehouse table
+            for table in surrogate_keys.transformed_tables(outputs):
+                transform_task >> PythonOperator(
+                    task_id = f"load_{WAREHOUSE_TABLES[table]}",
+                    python_callable = load_to_postgres,
+                    op_kwargs = {'tables': [table]},
+                    dag = dag
+                )
+else:
+    # Define Airflow tasks
+    ingest_sql_task = PythonOperator(
+        task_id = "ingest_data_from_sql_db",
+        python_callable = ingest_sql_source,
+        dag = dag
+    )
 
-load_data_to_warehouse = PythonOperator(
-    task_id = "Load_transformed_data_to_data_warehouse",
-    python_callable = load_to_postgres,
-    dag = dag
-)
+    ingest_api_task = PythonOperator(
+        task_id = "ingest_data_from_api",
+        python_callable = ingest_api_data,
+        dag = dag
+    )
 
-# Set task dependencies
-check_staging_task >> [ingest_sql_task, ingest_api_task]  
-check_staging_task >> transformed_data_task >> load_data_to_warehouse
\ No newline at end of file
+    if TRANSFORM_LOAD_MODE == 'fused':
+        # One task: each table is loaded while the next one is transformed
+        transformed_data_task = PythonOperator(
+            task_id = TRANSFORM_TASK_ID,
+            python_callable = transform_and_load,
+            trigger_rule = "none_failed_min_one_success",
+            dag = dag
+        )
+        load_data_to_warehouse = None
+    else:
+        transformed_data_task = PythonOperator(
+            task_id = TRANSFORM_TASK_ID,
+            python_callable = transforming_data,
+            trigger_rule = "none_failed_min_one_success",   # Runs after ingestion, or straight after the branch when ingestion is skipped
+            dag = dag
+        )
+
+        load_data_to_warehouse = PythonOperator(
+            task_id = "Load_transformed_data_to_data_warehouse",
+            python_callable = load_to_postgres,
+            dag = dag
+        )
+
+    # Set task dependencies
+    check_staging_task >> [ingest_sql_task, ingest_api_task] >> transformed_data_task
+    check_staging_task >> transformed_data_task
+    if load_data_to_warehouse is not None:
+        transformed_data_task >> load_data_to_warehouse
@@ -0,0 +1 @@
+"""Helper modules shared by the full_etl DAG"""
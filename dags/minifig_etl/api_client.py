@@ -0,0 +1,244 @@
+"""Concurrent, rate-limit-aware client for the paginated Rebrickable API.
+
+The first page is fetched on its own to learn `count` and the page size; every remaining
+page URL is then computed up front and fetched concurrently over one keep-alive session.
+A shared token bucket keeps the request rate under the API limit and honours `Retry-After`
+on 429 responses; 5xx responses and connection errors are retried with jittered exponential backoff.
+
+Pages are written to disk as soon as they arrive (one NDJSON segment per page) and a checkpoint
+records which pages are complete, so a retried task only fetches the pages that are still missing.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from minifig_etl import instrumentation
+
+# Client settings
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "4"))           # Pages in flight at once
+API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", "1"))           # Sustained requests per second
+API_RATE_BURST = int(os.getenv("API_RATE_BURST", "3"))             # Requests allowed back to back
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "5"))
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", "1"))       # Seconds before the first retry
+API_BACKOFF_CAP = float(os.getenv("API_BACKOFF_CAP", "60"))
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.wait_time = 0.0  # Total seconds spent waiting for tokens or Retry-After
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+
+                self.wait_time += delay
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (the server asked us to back off)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+class PageStore:
+    """Writes each fetched page to its own NDJSON segment and checkpoints progress so retries resume.
+
+    `mode` is the fetch mode ('sync' or 'async') that fills the store. The async fetch resumes a
+    sync checkpoint, but the sync fetch follows `next` links from the last page and cannot fill
+    the gaps an async attempt leaves, so it starts over instead.
+    """
+
+    def __init__(self, folder, api_url, mode='sync'):
+        self.folder = folder
+        self.checkpoint_path = os.path.join(folder, "checkpoint.json")
+        os.makedirs(folder, exist_ok=True)
+
+        # A checkpoint left by a failed attempt against the same endpoint is resumed; anything else starts over
+        self.state = {"api_url": api_url, "mode": mode, "count": None, "page_size": None, "next_url": api_url, "completed_pages": []}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+            if saved.get("api_url") == api_url and (mode == 'async' or saved.get("mode", "sync") == 'sync'):
+                self.state = dict(saved, mode=mode)
+                print(f"Resuming API ingestion: {len(saved['completed_pages'])} pages already on disk")
+            else:
+                print(f"Discarding the API checkpoint of a {saved.get('mode', 'sync')} fetch, starting over")
+
+    def is_done(self, page):
+        return page in self.state["completed_pages"]
+
+    def segment_path(self, page):
+        return os.path.join(self.folder, f"page-{page:06d}.ndjson")
+
+    def save_page(self, page, records, next_url=None, count=None, page_size=None):
+        """Persist one page, then record it in the checkpoint (segment first, so a checkpointed page always exists)"""
+        tmp_path = f"{self.segment_path(page)}.tmp"
+        with open(tmp_path, "w") as segment:
+            for record in records:
+                segment.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.segment_path(page))
+
+        if page not in self.state["completed_pages"]:
+            self.state["completed_pages"].append(page)
+        self.state["next_url"] = next_url
+        if count is not None:
+            self.state["count"] = count
+            self.state["page_size"] = page_size
+        self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump(self.state, checkpoint_file)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def iter_pages(self):
+        """Yield the records of each completed page in page order, one page in memory at a time"""
+        for page in sorted(self.state["completed_pages"]):
+            with open(self.segment_path(page)) as segment:
+                yield [json.loads(line) for line in segment]
+
+    def clear(self):
+        """Remove the segments and checkpoint once the pages have been consolidated"""
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)"""
+    return random.uniform(0, min(API_BACKOFF_CAP, API_BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after_delay(value, attempt):
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date); jittered backoff if it does not parse"""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return backoff_delay(attempt)
+
+
+def page_urls(first_url, count, page_size):
+    """Build the URLs of pages 2..N from the total record count and the page size"""
+    parts = urlsplit(first_url)
+    query = dict(parse_qsl(parts.query))
+    query['page_size'] = page_size
+
+    urls = {}
+    for page in range(2, math.ceil(count / page_size) + 1):
+        query['page'] = page
+        urls[page] = urlunsplit(parts._replace(query=urlencode(query)))
+    return urls
+
+
+async def fetch_page(session, url, bucket, max_retries=API_MAX_RETRIES):
+    """Fetch one page as JSON, retrying on 429, 5xx and connection errors"""
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    body = await response.read()
+                    instrumentation.record(pages=1, bytes_read=len(body))
+                    return json.loads(body)
+
+                if response.status == 429:
+                    # API rate limit hit: hold every request until the server's Retry-After has passed
+                    retry_after = retry_after_delay(response.headers.get("Retry-After", API_BACKOFF_BASE), attempt)
+                    print(f"Rate limit exceeded! Waiting for {retry_after} seconds before retrying {url}")
+                    bucket.pause(retry_after)
+                    continue
+
+                if response.status < 500:
+                    raise RuntimeError(f"Failed to fetch {url}: {response.status}, {await response.text()}")
+
+                print(f"Server error {response.status} on {url} (attempt {attempt + 1})")
+
+        except aiohttp.ClientError as e:
+            print(f"Connection error on {url} (attempt {attempt + 1}): {e}")
+
+        await asyncio.sleep(backoff_delay(attempt))
+
+    raise RuntimeError(f"Giving up on {url} after {max_retries} retries")
+
+
+async def fetch_all_pages(api_url, api_key, page_store, concurrency=API_CONCURRENCY):
+    """Fetch every page of a paginated endpoint into `page_store`, skipping pages it already holds"""
+    bucket = TokenBucket(API_RATE_LIMIT, API_RATE_BURST)
+    headers = {"Authorization": f"key {api_key}"}
+    connector = aiohttp.TCPConnector(limit=concurrency)  # Connections are kept alive and reused between pages
+
+    fetched = 0
+
+    async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+        # Page 1 gives the count and page size; a checkpoint of the sync fetch records neither, so page 1 is fetched again
+        if not page_store.is_done(1) or page_store.state["page_size"] is None:
+            fetched += 1
+            first_page = await fetch_page(session, api_url, bucket)
+            results = first_page.get("results", [])
+            page_store.save_page(1, results, first_page.get("next"), first_page.get("count", len(results)), len(results))
+            instrumentation.record(rows_out=len(results))
+
+        count, page_size = page_store.state["count"], page_store.state["page_size"]
+        if not count:
+            return 0
+        if not page_size:
+            raise RuntimeError(f"{api_url} reports {count} records but returned an empty first page")
+
+        # Every other page URL is known once the total count and page size are
+        urls = page_urls(api_url, count, page_size)
+        pending = {page: url for page, url in urls.items() if not page_store.is_done(page)}
+        print(f"{count} records over {len(urls) + 1} pages of {page_size}; {len(pending)} pages to fetch")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_and_store(page, url):
+            async with semaphore:
+                data = await fetch_page(session, url, bucket)
+            # Written as soon as it arrives, so memory holds at most `concurrency` pages
+            page_store.save_page(page, data.get("results", []))
+            instrumentation.record(rows_out=len(data.get("results", [])))
+
+        await asyncio.gather(*(fetch_and_store(page, url) for page, url in pending.items()))
+        fetched += len(pending)
+
+    print(f"Fetched {fetched} pages; {bucket.wait_time:.1f}s spent waiting on the rate limit")
+    instrumentation.record(rate_limit_wait_s=round(bucket.wait_time, 3))
+    return count
+
+
+def fetch_pages_to_store(api_url, api_key, page_store, concurrency=API_CONCURRENCY):
+    """Synchronous entry point for Airflow tasks"""
+    return asyncio.run(fetch_all_pages(api_url, api_key, page_store, concurrency))
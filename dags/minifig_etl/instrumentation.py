@@ -0,0 +1,182 @@
+"""Structured spans for the extract, transform and load steps.
+
+`span()` times one step and records the rows in and out, the bytes read and written, and the
+process's peak memory. Steps add their own counters, such as the API's `rate_limit_wait_s`.
+`task()` wraps an Airflow task callable in a root span. Every finished span is appended as one
+JSON line to METRICS_FILE, and a task's spans are pushed to XCom under the `metrics` key.
+METRICS_PROFILE adds cProfile and/or tracemalloc capture per task.
+"""
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+METRICS_FILE = os.getenv("METRICS_FILE", "./data/state/metrics.jsonl")
+# Comma-separated: 'cprofile' writes a .prof file per task (main thread only), 'tracemalloc' a top-allocations report
+METRICS_PROFILE = {mode.strip() for mode in os.getenv("METRICS_PROFILE", "").lower().split(",") if mode.strip()}
+METRICS_PROFILE_DIR = os.getenv("METRICS_PROFILE_DIR", "./data/state/profiles")
+
+_local = threading.local()   # Open spans of each thread, innermost last
+_lock = threading.Lock()
+_task = {'name': None, 'run_id': None, 'spans': None}   # The running task (one per process under Airflow)
+
+
+class Span:
+    """Counters of one step; `add` accumulates (rows_in, rows_out, bytes_read, bytes_written, ...)"""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.metrics = {}
+
+    def add(self, **values):
+        with _lock:
+            for key, value in values.items():
+                self.metrics[key] = self.metrics.get(key, 0) + value
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    # VmHWM belongs to this process image; ru_maxrss would also count the parent the process was forked from
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    # ru_maxrss is in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def path_size(path):
+    """Size in bytes of a stored table (a file, or every part file of a table directory)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _stack():
+    if not hasattr(_local, 'spans'):
+        _local.spans = []
+    return _local.spans
+
+
+def record(**values):
+    """Add counters to the innermost open span of this thread (no-op outside a span)"""
+    stack = _stack()
+    if stack:
+        stack[-1].add(**values)
+
+
+def _emit(entry):
+    line = json.dumps(entry, default=str) + "\n"
+    with _lock:
+        if _task['spans'] is not None:
+            _task['spans'].append(entry)
+        os.makedirs(os.path.dirname(METRICS_FILE) or '.', exist_ok=True)
+        # One write per line, so tasks running in parallel can append to the same file
+        with open(METRICS_FILE, 'a') as metrics_file:
+            metrics_file.write(line)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time a step; the yielded Span collects its counters"""
+    current = Span(name, attributes)
+    stack = _stack()
+    stack.append(current)
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    error = None
+
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        entry = {
+            'task': _task['name'],
+            'run_id': _task['run_id'],
+            'span': name,
+            **attributes,
+            'start': started_at.isoformat(),
+            'duration_s': round(time.perf_counter() - start, 3),
+            **current.metrics,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'status': 'error' if error else 'ok',
+        }
+        if error:
+            entry['error'] = error
+        _emit(entry)
+
+
+def _airflow_context():
+    try:
+        from airflow.operators.python import get_current_context
+        return get_current_context()
+    except Exception:
+        return None   # Not running inside an Airflow task
+
+
+def _write_profiles(name, profiler):
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    os.makedirs(METRICS_PROFILE_DIR, exist_ok=True)
+
+    if profiler is not None:
+        profile_path = os.path.join(METRICS_PROFILE_DIR, f"{name}-{stamp}.prof")
+        profiler.dump_stats(profile_path)
+        print(f"cProfile stats written to {profile_path} (inspect with python -m pstats)")
+
+    if tracemalloc.is_tracing():
+        report_path = os.path.join(METRICS_PROFILE_DIR, f"{name}-{stamp}.tracemalloc.txt")
+        with open(report_path, 'w') as report:
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:25]:
+                report.write(f"{stat}\n")
+        tracemalloc.stop()
+        print(f"Top allocations written to {report_path}")
+
+
+def task(name):
+    """Decorator for task callables: a root span, optional profiling, and the task's spans pushed to XCom"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # A task called from another task (transform_and_load -> transforming_data) is just a nested span
+            if _task['name'] is not None:
+                with span(name):
+                    return func(*args, **kwargs)
+
+            context = _airflow_context() or {}
+            _task.update(name=name, run_id=context.get('run_id'), spans=[])
+            profiler = cProfile.Profile() if 'cprofile' in METRICS_PROFILE else None
+            if 'tracemalloc' in METRICS_PROFILE:
+                tracemalloc.start()
+
+            try:
+                with span(name) as task_span:
+                    if profiler is not None:
+                        profiler.enable()
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        if profiler is not None:
+                            profiler.disable()
+                        if tracemalloc.is_tracing():
+                            task_span.add(python_peak_mb=round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1))
+            finally:
+                if METRICS_PROFILE:
+                    _write_profiles(name, profiler)
+                if 'ti' in context:
+                    context['ti'].xcom_push(key='metrics', value=_task['spans'])
+                _task.update(name=None, run_id=None, spans=None)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,215 @@
+"""Memory-budgeted join planning for the inventory outputs (JOIN_PLANNER, pandas engine).
+
+The plain builders materialise the full inventory master datasets: every left merge copies every
+column of both sides, and the renames afterwards copy the result again. Here each output has a
+plan instead: a fact table and the N:1 lookups joined onto it, in merge order. Planning
+- projects the fact table to the columns the output (and the keys of later lookups) needs,
+- drops lookups that add no column the output reads and cannot fan rows out (unique dimension key),
+- for dimension_parts, probes the distinct part numbers instead of every inventory row.
+
+A lookup on a unique key is probed through a hash index of the dimension key, built once per run
+and kept in the shared cache; the matching rows are taken by position (an int16/int32 array)
+instead of running a merge. A dimension with duplicate keys falls back to a merge of its projected
+columns, so rows fan out exactly as the merge chain would. When the projected fact rows exceed
+JOIN_MEMORY_BUDGET_MB they are probed in chunks, bounding the probe's temporary arrays.
+
+The outputs hold the same rows and columns as transform.OUTPUT_BUILDERS.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from minifig_etl import instrumentation, transform
+from minifig_etl.transform import _shared
+
+JOIN_PLANNER = os.getenv("JOIN_PLANNER", "false").lower() == "true"
+# Memory the projected fact rows of one probe may take; 0 probes every row at once
+JOIN_MEMORY_BUDGET_MB = int(os.getenv("JOIN_MEMORY_BUDGET_MB", "0"))
+# Smallest chunk probed under the budget
+MIN_CHUNK_ROWS = 10_000
+
+
+class Lookup:
+    """N:1 join of a dimension onto the fact rows: fact `left_on` = dimension `right_on`.
+
+    `table` returns the dimension (called only if the plan keeps the lookup); `columns` maps the
+    dimension columns the join adds to their names in the joined frame.
+    """
+
+    def __init__(self, name, table, left_on, right_on, columns=None):
+        self.name = name
+        self.table = table
+        self.left_on = left_on
+        self.right_on = right_on
+        self.columns = columns or {}
+
+
+def _key_index(lookup, cache):
+    """Hash index of a dimension's join key and whether the key is unique (built once per run)"""
+    def build():
+        index = pd.Index(lookup.table()[lookup.right_on])
+        return index, index.is_unique
+
+    return _shared(cache, ('join_index', lookup.name, lookup.right_on), build)
+
+
+def _positions(index, values):
+    """Row of the dimension matching each value (-1 for no match), in the smallest integer type that holds it"""
+    positions = index.get_indexer(values)
+    return positions.astype(np.int16 if len(index) < np.iinfo(np.int16).max else np.int32)
+
+
+def _probe(frame, steps, counters):
+    """Run the planned lookups over a block of fact rows"""
+    for lookup, index, unique, take in steps:
+        dimension = lookup.table()
+        if unique:
+            positions = _positions(index, frame[lookup.left_on])
+            values = dimension[list(take)]
+            if (positions < 0).any():
+                # A trailing all-null row stands in for the misses, with the dtypes a left merge would give
+                values = pd.concat([values, values.iloc[:0].reindex([len(values)])], ignore_index=True)
+                positions = np.where(positions < 0, len(values) - 1, positions)
+            rows = values.iloc[positions]
+            for column, name in take.items():
+                frame[name] = rows[column].array
+            counters['join_lookups'] += 1
+        else:
+            # Duplicate dimension keys fan rows out, which only a merge reproduces
+            right = pd.DataFrame({'_join_key': dimension[lookup.right_on], **{name: dimension[column] for column, name in take.items()}})
+            frame = frame.merge(right, how='left', left_on=lookup.left_on, right_on='_join_key').drop(columns='_join_key')
+            counters['join_merges'] += 1
+    return frame
+
+
+def plan_join(fact, lookups, columns, cache, rename=None, distinct=False):
+    """Left-join `lookups` onto `fact` in order and return `columns` of the result (renamed by `rename`).
+
+    With `distinct`, only the distinct rows of the result are wanted, so duplicate fact rows are
+    dropped before probing and lookups that add no column are skipped whatever their keys.
+    """
+    # Walk back from the output: keep the lookups that add a needed column or may fan rows out
+    needed, steps = set(columns), []
+    for lookup in reversed(lookups):
+        take = {column: name for column, name in lookup.columns.items() if name in needed}
+        if not take and distinct:
+            continue
+        index, unique = _key_index(lookup, cache)
+        if not take and unique:
+            continue
+        steps.insert(0, (lookup, index, unique, take))
+        needed.difference_update(take.values())
+        needed.add(lookup.left_on)
+
+    frame = fact[[column for column in fact.columns if column in needed]]
+    if distinct:
+        frame = frame.drop_duplicates()
+
+    # Chunk the probe when the projected rows (plus the added columns) would exceed the budget
+    row_bytes = frame.memory_usage(index=False).sum() / max(len(frame), 1) + 8 * sum(len(take) for *_, take in steps)
+    chunk_rows = len(frame)
+    if JOIN_MEMORY_BUDGET_MB > 0 and len(frame) * row_bytes > JOIN_MEMORY_BUDGET_MB * 2**20:
+        chunk_rows = max(MIN_CHUNK_ROWS, int(JOIN_MEMORY_BUDGET_MB * 2**20 / row_bytes))
+
+    counters = {'join_lookups': 0, 'join_merges': 0}
+    chunks = [
+        _probe(frame.iloc[start:start + chunk_rows].reset_index(drop=True), steps, counters)[columns]
+        for start in range(0, max(len(frame), 1), max(chunk_rows, 1))
+    ]
+    result = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+    instrumentation.record(join_chunks=len(chunks), **counters)
+
+    if rename:
+        result = result.rename(columns=rename)
+    return result.drop_duplicates() if distinct else result
+
+
+## Plans
+def _inventory_parts_lookups(raw, cache):
+    """inventory_parts -> parts (+ categories), colors, relationship summary (the inventory_parts_master merge order)"""
+    if 'part_details' in raw:
+        # Parts already joined with their categories in the source database
+        part_lookups = [Lookup('part_details', lambda: raw['part_details'], 'part_num', 'part_num', {
+            'part_name': 'part_name', 'part_cat_id': 'part_cat_id', 'part_material': 'part_material', 'part_category_name': 'part_category_name',
+        })]
+    else:
+        part_lookups = [
+            Lookup('parts', lambda: raw['parts'], 'part_num', 'part_num', {'name': 'part_name', 'part_cat_id': 'part_cat_id', 'part_material': 'part_material'}),
+            Lookup('part_categories', lambda: raw['part_categories'], 'part_cat_id', 'id', {'name': 'part_category_name'}),
+        ]
+    summary = lambda: _shared(cache, 'part_relationship_summary_frame', lambda: transform.part_relationship_summary(raw, cache).reset_index())
+    return part_lookups + [
+        Lookup('colors', lambda: raw['colors'], 'color_id', 'id'),
+        Lookup('part_relationship_summary', summary, 'part_num', 'parent_part_num', {'rel_type': 'rel_type', 'rel_type_desc': 'rel_type_desc'}),
+    ]
+
+
+def _summarized_inventory_ids(raw, cache):
+    """inventory_id of each summarized inventory row (the only summarized column an output reads)"""
+    if 'summarized_inventories' in raw:
+        # Joined in the source database
+        return raw['summarized_inventories']
+    return _shared(cache, 'summarized_inventory_ids', lambda: plan_join(raw['inventories'], [
+        Lookup('sets', lambda: raw['sets'], 'set_num', 'set_num', {'theme_id': 'theme_id'}),
+        Lookup('themes', lambda: raw['themes'], 'theme_id', 'id'),
+    ], ['id'], cache, rename={'id': 'inventory_id'}))
+
+
+## Dimensional modeling (same outputs as transform.OUTPUT_BUILDERS)
+def build_dimension_parts(raw, cache):
+    """Dimension Parts table"""
+    return plan_join(
+        raw['inventory_parts'], _inventory_parts_lookups(raw, cache),
+        ['part_name', 'part_num', 'part_cat_id', 'part_category_name', 'part_material', 'rel_type', 'rel_type_desc'], cache,
+        rename={'part_name': 'partName', 'part_num': 'partNumber', 'part_cat_id': 'partCategoryId', 'part_category_name': 'partCategoryName',
+                'part_material': 'partMaterial', 'rel_type': 'relationshipType', 'rel_type_desc': 'relationshipTypeDesc'},
+        distinct=True,
+    )
+
+
+def build_ft_inv_minifigs(raw, cache):
+    """Facts inventory minifigs"""
+    df = plan_join(raw['inventory_minifigs'], [
+        Lookup('minifigs', lambda: raw['minifigs'], 'fig_num', 'set_num', {'set_num': 'set_num', 'set_url': 'set_url', 'last_modified_dt': 'last_modified'}),
+        Lookup('summarized_inventories', lambda: _summarized_inventory_ids(raw, cache), 'inventory_id', 'inventory_id'),
+    ], ['inventory_id', 'fig_num', 'quantity', 'set_num', 'set_url', 'last_modified'], cache)
+
+    # Change last_modified from object to Timestamp
+    df['last_modified'] = pd.to_datetime(df['last_modified'])
+    return df
+
+
+def build_ft_inv_sets(raw, cache):
+    """Facts inventory sets"""
+    if 'inventory_sets_master' in raw:
+        # Joined in the source database
+        return transform.build_ft_inv_sets(raw, cache)
+    return plan_join(raw['inventory_sets'], [
+        Lookup('sets', lambda: raw['sets'], 'set_num', 'set_num', {'num_parts': 'num_parts', 'img_url': 'set_img_url', 'theme_id': 'theme_id'}),
+        Lookup('themes', lambda: raw['themes'], 'theme_id', 'id'),
+    ], ['inventory_id', 'set_num', 'num_parts', 'set_img_url', 'quantity'], cache, rename={'set_num': 'setnum'})
+
+
+def build_ft_inv_parts(raw, cache):
+    """Facts inventory parts"""
+    return plan_join(
+        raw['inventory_parts'], _inventory_parts_lookups(raw, cache),
+        ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare', 'img_url'], cache, rename={'part_num': 'part_num_id'},
+    )
+
+
+# Output table -> planned builder (the dimension_sets and dimension_colors builders run no joins)
+OUTPUT_BUILDERS = {
+    'dimension_parts': build_dimension_parts,
+    'ft_inv_minifigs': build_ft_inv_minifigs,
+    'ft_inv_sets': build_ft_inv_sets,
+    'ft_inv_parts': build_ft_inv_parts,
+}
+
+
+def output_builders():
+    """Builder of every output: transform.OUTPUT_BUILDERS, with the planned builders when JOIN_PLANNER is on"""
+    if not JOIN_PLANNER:
+        return transform.OUTPUT_BUILDERS
+    return dict(transform.OUTPUT_BUILDERS, **OUTPUT_BUILDERS)
@@ -0,0 +1,141 @@
+"""Persistent store of the lookup and dimension tables, shared by tasks and runs (LOOKUP_STORE).
+
+The small, frequently joined tables are kept as uncompressed Arrow IPC files under
+LOOKUP_STORE_DIR, already typed, and read back through a memory map: no Parquet/CSV decode and no
+schema casts. Each entry is versioned by the content fingerprint of the table it was read from,
+so a changed source table gets a new entry while unchanged ones are reused by every task and
+every later run. LOOKUP_STORE_VERSIONS entries are kept per table; the least recently used are
+evicted.
+
+- extract publishes the raw lookup tables as it writes them
+- transform reads the raw lookups from the store, and also keeps the part relationship summary there
+- transform publishes the dimension outputs it writes, which the load task then reads
+"""
+import hashlib
+import inspect
+import json
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from minifig_etl import storage, transform, transform_cache
+
+LOOKUP_STORE = os.getenv("LOOKUP_STORE", "false").lower() == "true"
+LOOKUP_STORE_DIR = os.getenv("LOOKUP_STORE_DIR", "./data/state/lookups")
+# Versions kept per table (the least recently used are evicted)
+LOOKUP_STORE_VERSIONS = int(os.getenv("LOOKUP_STORE_VERSIONS", "2"))
+
+# Raw reference tables and transformed dimension tables served from the store
+STORED_TABLES = [
+    'colors', 'themes', 'part_categories', 'parts', 'sets', 'part_details',
+    'dimension_sets', 'dimension_colors', 'dimension_parts', 'dimension_minifigs', 'dimension_part_images',
+]
+
+_MANIFEST_FILE = os.path.join(LOOKUP_STORE_DIR, 'manifest.json')
+_fingerprints = {}   # (path, file stats) -> content fingerprint, so a table is hashed once per process
+
+
+def stored(table):
+    return LOOKUP_STORE and table in STORED_TABLES
+
+
+def table_fingerprint(path):
+    """Content fingerprint of a stored table (see transform_cache.fingerprint_path), cached while its files are unchanged"""
+    files = [path] if os.path.isfile(path) else sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    stats = tuple((file_path, os.stat(file_path).st_mtime_ns, os.path.getsize(file_path)) for file_path in files)
+    if (path, stats) not in _fingerprints:
+        _fingerprints[(path, stats)] = transform_cache.fingerprint_path(path)
+    return _fingerprints[(path, stats)]
+
+
+def version(*parts):
+    """Version id of an entry: a hash of whatever its content depends on"""
+    return hashlib.blake2b("\n".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def table_version(folder, table):
+    """Version of a table read from `folder`: its content, format and declared dtypes"""
+    return version(table_fingerprint(storage.table_path(folder, table)), storage.STORAGE_FORMAT, repr(storage.TABLE_SCHEMAS.get(table)))
+
+
+def _entry_path(name, entry_version):
+    return os.path.join(LOOKUP_STORE_DIR, name, f"{entry_version}.arrow")
+
+
+def _update_manifest(update):
+    """Apply `update` to the manifest of stored entries under the store's lock"""
+    with storage.file_lock(_MANIFEST_FILE):
+        manifest = {}
+        if os.path.exists(_MANIFEST_FILE):
+            with open(_MANIFEST_FILE) as manifest_file:
+                manifest = json.load(manifest_file)
+        update(manifest)
+        with open(_MANIFEST_FILE, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+
+def put(name, entry_version, df):
+    """Store a DataFrame as version `entry_version` of `name` and evict the least recently used versions"""
+    path = _entry_path(name, entry_version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrow_table = pa.Table.from_pandas(df)
+    # Written aside and renamed, so tasks reading the entry never see a partial file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(temp_path, 'wb') as sink, ipc.new_file(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    os.replace(temp_path, path)
+
+    def register(manifest):
+        versions = manifest.setdefault(name, {})
+        versions[entry_version] = {'last_used': time.time(), 'rows': len(df)}
+        for old in sorted(versions, key=lambda v: versions[v]['last_used'], reverse=True)[LOOKUP_STORE_VERSIONS:]:
+            del versions[old]
+            if os.path.exists(_entry_path(name, old)):
+                os.remove(_entry_path(name, old))
+
+    _update_manifest(register)
+
+
+def get(name, entry_version, build):
+    """Version `entry_version` of `name` from the store, or `build()` it and store it"""
+    path = _entry_path(name, entry_version)
+    try:
+        # The map stays open while the frame references it; an entry evicted meanwhile stays readable
+        df = ipc.open_file(pa.memory_map(path)).read_all().to_pandas()
+    except FileNotFoundError:
+        df = build()
+        put(name, entry_version, df)
+        return df
+
+    def touch(manifest):
+        manifest.setdefault(name, {}).setdefault(entry_version, {})['last_used'] = time.time()
+
+    _update_manifest(touch)
+    return df
+
+
+def read_table(folder, table):
+    """storage.read_table, served from the store for STORED_TABLES"""
+    if not stored(table):
+        return storage.read_table(folder, table)
+    return get(table, table_version(folder, table), lambda: storage.read_table(folder, table))
+
+
+def publish(folder, table, df=None):
+    """Store the table just written to `folder` (`df` is its content, if already in memory)"""
+    if stored(table):
+        entry_version = table_version(folder, table)
+        if df is None:
+            get(table, entry_version, lambda: storage.read_table(folder, table))
+        elif not os.path.exists(_entry_path(table, entry_version)):
+            # Typed and indexed as storage.read_table would return it
+            put(table, entry_version, storage.apply_schema(df.reset_index(drop=True), table))
+
+
+def part_relationship_summary(folder, raw, cache):
+    """transform.part_relationship_summary from the store, versioned by part_relationships (in `folder`) and the code summarising it"""
+    entry_version = version(table_version(folder, 'part_relationships'), inspect.getsource(transform.summarize_part_relationships))
+    cache['part_relationship_summary'] = get('part_relationship_summary', entry_version, lambda: transform.part_relationship_summary(raw, {}))
+    return cache['part_relationship_summary']
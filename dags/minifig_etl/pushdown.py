@@ -0,0 +1,58 @@
+"""Query pushdown for SQL extraction (SQL_PUSHDOWN).
+
+'columns' selects only the columns the star schema reads from each source table
+(`transform.OUTPUT_COLUMNS`). 'joins' also has the source Postgres build the pre-joined datasets in
+`transform.PREJOINED_INPUTS`, where its primary keys and indexes serve the joins. The source tables
+they stand in for are then not extracted at all. Each dataset keeps exactly the columns the pandas
+merges use, and keeps joins whose columns are not selected so rows fan out as they do in pandas.
+"""
+from minifig_etl.transform import REL_TYPE_MAPPING, required_columns
+
+_REL_TYPE_DESC = "CASE rel_type " + " ".join(
+    f"WHEN '{code}' THEN '{desc}'" for code, desc in REL_TYPE_MAPPING.items()
+) + " END"
+
+# Pre-joined dataset -> Postgres query (column names as the pandas merges leave them)
+PREJOINED_QUERIES = {
+    # One row per part, with its category
+    'part_details': """
+        SELECT
+            p.part_num, p.name AS part_name, p.part_cat_id, p.part_material,
+            pc.id AS part_categories_id, pc.name AS part_category_name
+        FROM parts p
+        LEFT JOIN part_categories pc ON pc.id = p.part_cat_id
+    """,
+    # One row per parent part; codes joined in sorted order like the pandas summary
+    'part_relationship_summary': f"""
+        SELECT
+            parent_part_num,
+            string_agg(rel_type, ', ' ORDER BY rel_type COLLATE "C") AS rel_type,
+            string_agg(rel_type_desc, ', ' ORDER BY rel_type COLLATE "C") AS rel_type_desc
+        FROM (
+            SELECT DISTINCT parent_part_num, rel_type::text AS rel_type, {_REL_TYPE_DESC} AS rel_type_desc
+            FROM part_relationships
+            WHERE rel_type IN ({', '.join(f"'{code}'" for code in REL_TYPE_MAPPING)})
+        ) pairs
+        WHERE parent_part_num IS NOT NULL
+        GROUP BY parent_part_num
+    """,
+    # No summarized column reaches an output, so only the key is kept
+    'summarized_inventories': """
+        SELECT i.id AS inventory_id
+        FROM inventories i
+        LEFT JOIN sets s ON s.set_num = i.set_num
+        LEFT JOIN themes t ON t.id = s.theme_id
+    """,
+    'inventory_sets_master': """
+        SELECT iset.inventory_id, iset.set_num AS setnum, s.num_parts AS numparts, s.img_url AS set_img_url, iset.quantity
+        FROM inventory_sets iset
+        LEFT JOIN sets s ON s.set_num = iset.set_num
+        LEFT JOIN themes t ON t.id = s.theme_id
+    """,
+}
+
+
+def select_query(table):
+    """SELECT of the columns the star schema reads from a source table (every column for tables it does not read)"""
+    columns = required_columns(table)
+    return f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
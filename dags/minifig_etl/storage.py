@@ -0,0 +1,217 @@
+"""Storage format layer for the raw and transformed data folders.
+
+Tables are written as Parquet (default), Arrow IPC or CSV. The columnar formats store each
+table as a directory of part files (`<table>.parquet/part-00000.parquet`, ...) so chunked
+extraction and incremental runs can append without rewriting what is already on disk.
+"""
+import contextlib
+import fcntl
+import glob
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+# 'parquet', 'arrow' (IPC) or 'csv'; CSV is kept as an opt-in export format
+STORAGE_FORMAT = os.getenv("STORAGE_FORMAT", "parquet")
+
+FILE_EXTENSIONS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+# Memory-mapped reads for the columnar formats
+_local_fs = pafs.LocalFileSystem(use_mmap=True)
+
+# Explicit per-table dtypes (raw and transformed layers). Columns not listed keep their inferred type.
+# Nullable extension types are used so left-join gaps survive the round trip. Keys and text that may
+# look numeric ('3001' next to '3001pr9') are declared 'string', so every part file of a table
+# stores them with the same type.
+TABLE_SCHEMAS = {
+    # Raw layer
+    'inventories': {'id': 'Int32', 'version': 'Int32', 'set_num': 'string'},
+    'inventory_parts': {'inventory_id': 'Int32', 'part_num': 'string', 'color_id': 'Int32', 'quantity': 'Int32', 'is_spare': 'boolean',
+                        'img_url': 'string'},
+    'inventory_minifigs': {'inventory_id': 'Int32', 'fig_num': 'string', 'quantity': 'Int32'},
+    'inventory_sets': {'inventory_id': 'Int32', 'set_num': 'string', 'quantity': 'Int32'},
+    'minifigs': {'set_num': 'string', 'name': 'string', 'num_parts': 'Int32', 'img_url': 'string', 'last_modified_dt': 'datetime'},
+    'colors': {'id': 'Int32', 'name': 'string', 'rgb': 'string', 'is_trans': 'boolean', 'num_parts': 'Int32', 'num_sets': 'Int32',
+               'y1': 'Int32', 'y2': 'Int32'},
+    'elements': {'part_num': 'string', 'color_id': 'Int32', 'design_id': 'Int64'},
+    'part_categories': {'id': 'Int32', 'name': 'string'},
+    'part_relationships': {'rel_type': 'category', 'child_part_num': 'string', 'parent_part_num': 'string'},
+    'parts': {'part_num': 'string', 'name': 'string', 'part_cat_id': 'Int32', 'part_material': 'category'},
+    'sets': {'set_num': 'string', 'name': 'string', 'year': 'Int32', 'theme_id': 'Int32', 'num_parts': 'Int32', 'img_url': 'string'},
+    'themes': {'id': 'Int32', 'name': 'string', 'parent_id': 'Int32'},
+
+    # Pre-joined raw datasets (SQL_PUSHDOWN=joins)
+    'part_details': {'part_num': 'string', 'part_cat_id': 'Int32', 'part_material': 'category', 'part_categories_id': 'Int32'},
+    'part_relationship_summary': {'parent_part_num': 'string'},
+    'summarized_inventories': {'inventory_id': 'Int32'},
+    'inventory_sets_master': {'inventory_id': 'Int32', 'numparts': 'Int32', 'quantity': 'Int32'},
+
+    # Transformed layer
+    'dimension_sets': {'setKey': 'Int32', 'year': 'Int32', 'themeId': 'Int32', 'numParts': 'Int32'},
+    'dimension_colors': {'colorKey': 'Int32', 'colorId': 'Int32', 'isTransparent': 'boolean', 'numParts': 'Int32', 'numSets': 'Int32',
+                         'year1': 'Int32', 'year2': 'Int32'},
+    'dimension_parts': {'partKey': 'Int32', 'partCategoryId': 'Int32', 'partMaterial': 'category'},
+    'ft_inv_minifigs': {'inventory_id': 'Int32', 'minifig_key': 'Int32', 'quantity': 'Int32', 'last_modified': 'datetime'},
+    'ft_inv_sets': {'inventory_id': 'Int32', 'set_key': 'Int32', 'num_parts': 'Int32', 'quantity': 'Int32'},
+    'ft_inv_parts': {'inventory_id': 'Int32', 'part_key': 'Int32', 'color_key': 'Int32', 'color_id': 'Int32', 'quantity': 'Int32', 'is_spare': 'boolean'},
+
+    # Surrogate keys (SURROGATE_KEYS=true)
+    'dimension_minifigs': {'minifigKey': 'Int32'},
+    'dimension_part_images': {'partKey': 'Int32', 'colorKey': 'Int32'},
+    'part_keys': {'key': 'Int32'},
+    'set_keys': {'key': 'Int32'},
+    'minifig_keys': {'key': 'Int32'},
+    'color_keys': {'key': 'Int32'},
+}
+
+
+def table_path(folder, table, fmt=None):
+    """Path of a stored table (a file for CSV, a directory of part files for Parquet/Arrow)"""
+    fmt = fmt or STORAGE_FORMAT
+    return os.path.join(folder, f"{table}{FILE_EXTENSIONS[fmt]}")
+
+
+def table_exists(folder, table, fmt=None):
+    """Check whether a table has been written in the given format"""
+    return os.path.exists(table_path(folder, table, fmt))
+
+
+def delete_table(folder, table, fmt=None):
+    """Remove a stored table if it exists"""
+    path = table_path(folder, table, fmt)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `<path>.lock`, so tasks running in separate processes update a state file one at a time"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def apply_schema(df, table):
+    """Cast the columns of `df` to the explicit dtypes declared for `table`"""
+    for column, dtype in TABLE_SCHEMAS.get(table, {}).items():
+        if column not in df.columns:
+            continue
+        if dtype == 'datetime':
+            df[column] = pd.to_datetime(df[column], utc=True)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def csv_dtypes(table, columns):
+    """`dtype=` for reading a raw table from CSV in chunks: the declared types, and strings for undeclared columns.
+
+    Without it pandas infers each chunk's types on its own, and a chunk holding only numeric keys
+    would store them as integers.
+    """
+    dtypes = {}
+    for column in columns:
+        dtype = TABLE_SCHEMAS.get(table, {}).get(column)
+        if dtype is None or dtype in ('category', 'datetime'):
+            dtypes[column] = str
+        elif dtype == 'string' or dtype.startswith('Int'):
+            dtypes[column] = dtype
+        # Booleans are parsed from COPY's 't'/'f' and cast by apply_schema
+    return dtypes
+
+
+def _to_arrow(df):
+    """Convert a DataFrame to an Arrow table; all-null object columns become strings so part schemas line up"""
+    arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(arrow_table.schema):
+        if pa.types.is_null(field.type):
+            arrow_table = arrow_table.set_column(i, field.with_type(pa.string()), arrow_table.column(i).cast(pa.string()))
+    return arrow_table
+
+
+def write_table(df, folder, table, fmt=None, append=False):
+    """Write (or append) a DataFrame to `folder` in the configured storage format and return its path"""
+    fmt = fmt or STORAGE_FORMAT
+    path = table_path(folder, table, fmt)
+    os.makedirs(folder, exist_ok=True)
+    df = apply_schema(df.copy(deep=False), table)  # Shallow copy: casting must not change the caller's frame
+
+    if fmt == 'csv':
+        if append and os.path.exists(path):
+            df.to_csv(path, mode='a', header=False, index=False)
+        else:
+            df.to_csv(path, index=False)
+        return path
+
+    # Columnar formats: every write is a new part file inside the table directory
+    if not append:
+        delete_table(folder, table, fmt)
+    os.makedirs(path, exist_ok=True)
+
+    part_number = len(glob.glob(os.path.join(path, f"part-*{FILE_EXTENSIONS[fmt]}")))
+    _write_part_file(df, os.path.join(path, f"part-{part_number:05d}{FILE_EXTENSIONS[fmt]}"), fmt)
+    return path
+
+
+def _write_part_file(df, part_path, fmt):
+    arrow_table = _to_arrow(df)
+    if fmt == 'parquet':
+        pq.write_table(arrow_table, part_path)
+    else:
+        with pa.OSFile(part_path, 'wb') as sink, ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+
+
+def write_part(df, folder, table, part, fmt=None):
+    """Write part file number `part` of a Parquet/Arrow table, so parallel writers never pick the same file"""
+    fmt = fmt or STORAGE_FORMAT
+    path = table_path(folder, table, fmt)
+    os.makedirs(path, exist_ok=True)
+    _write_part_file(apply_schema(df.copy(deep=False), table), os.path.join(path, f"part-{part:05d}{FILE_EXTENSIONS[fmt]}"), fmt)
+    return path
+
+
+def read_table(folder, table, columns=None, fmt=None):
+    """Read a stored table, optionally selecting a subset of columns"""
+    fmt = fmt or STORAGE_FORMAT
+    path = table_path(folder, table, fmt)
+
+    if fmt == 'csv':
+        # 't'/'f' are the booleans written by COPY extraction
+        df = pd.read_csv(path, usecols=columns, true_values=['t'], false_values=['f'])
+        return apply_schema(df, table)
+
+    # Only the requested columns are read; part files are memory-mapped rather than copied into memory
+    dataset = ds.dataset(path, format='parquet' if fmt == 'parquet' else 'ipc', filesystem=_local_fs)
+    return apply_schema(dataset.to_table(columns=columns).to_pandas(), table)
+
+
+def iter_batches(folder, table, batch_size=100_000, fmt=None):
+    """Read a stored table as a sequence of DataFrames of at most `batch_size` rows"""
+    fmt = fmt or STORAGE_FORMAT
+    path = table_path(folder, table, fmt)
+
+    if fmt == 'csv':
+        for chunk in pd.read_csv(path, chunksize=batch_size, true_values=['t'], false_values=['f']):
+            yield apply_schema(chunk, table)
+        return
+
+    dataset = ds.dataset(path, format='parquet' if fmt == 'parquet' else 'ipc', filesystem=_local_fs)
+    for batch in dataset.to_batches(batch_size=batch_size):
+        yield apply_schema(batch.to_pandas(), table)
@@ -0,0 +1,177 @@
+"""Stable integer surrogate keys for parts, sets, minifigs and colors.
+
+With SURROGATE_KEYS enabled, every built output is compacted before it is saved or loaded:
+dimension tables gain an integer key column, and fact tables replace their string keys and
+repeated URLs with integer foreign keys. The URLs move into dimension tables
+(`dimension_minifigs`, `dimension_part_images`).
+
+Keys are assigned the first time a natural key is seen and are never reused. The mapping is
+persisted under SURROGATE_KEY_DIR, so a key means the same thing in every run, and tables
+built in different runs (for example, ones the transform cache skipped) still join.
+"""
+import contextlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from minifig_etl import storage
+
+SURROGATE_KEYS = os.getenv("SURROGATE_KEYS", "false").lower() == "true"
+SURROGATE_KEY_DIR = os.getenv("SURROGATE_KEY_DIR", "./data/state/surrogate_keys")
+
+# Outputs that are split into several tables when compacted
+COMPACT_TABLES = {
+    'ft_inv_minifigs': ['ft_inv_minifigs', 'dimension_minifigs'],
+    'ft_inv_parts': ['ft_inv_parts', 'dimension_part_images'],
+}
+
+
+class KeyStore:
+    """Natural key -> surrogate key mappings per entity (part, set, minifig, color), stored as `<entity>_keys` tables"""
+
+    def __init__(self, folder=SURROGATE_KEY_DIR):
+        self.folder = folder
+        self.mappings = {}
+        self.dirty = set()
+
+    def mapping(self, entity):
+        if entity not in self.mappings:
+            # Key maps are pipeline state, not exports, so they are always Parquet
+            if storage.table_exists(self.folder, f"{entity}_keys", fmt='parquet'):
+                stored = storage.read_table(self.folder, f"{entity}_keys", fmt='parquet')
+                self.mappings[entity] = pd.Series(stored['key'].to_numpy(dtype='int64'), index=pd.Index(stored['natural_key']))
+            else:
+                self.mappings[entity] = pd.Series([], dtype='int64', index=pd.Index([], dtype=object))
+        return self.mappings[entity]
+
+    def keys_for(self, entity, values):
+        """Surrogate keys for a column of natural keys; values seen for the first time get the next free keys"""
+        values = pd.Series(values).to_numpy(dtype=object)
+        missing = pd.isna(values)
+        mapping = self.mapping(entity)
+        positions = mapping.index.get_indexer(values)
+
+        new_values = pd.unique(values[(positions < 0) & ~missing])
+        if len(new_values):
+            # Sorted, so two fresh runs over the same data assign the same keys
+            new_values = np.sort(new_values)
+            start = int(mapping.max()) + 1 if len(mapping) else 1
+            new_keys = pd.Series(np.arange(start, start + len(new_values)), index=pd.Index(new_values, dtype=object))
+            mapping = self.mappings[entity] = pd.concat([mapping, new_keys])
+            self.dirty.add(entity)
+            positions = mapping.index.get_indexer(values)
+
+        keys = pd.array(mapping.to_numpy()[positions], dtype='Int32')
+        keys[missing] = pd.NA
+        return keys
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Assign and save keys while holding the store's lock; mappings are re-read so keys saved by other tasks are seen"""
+        with storage.file_lock(os.path.join(self.folder, 'keys')):
+            self.mappings.clear()
+            yield self
+
+    def save(self):
+        for entity in sorted(self.dirty):
+            mapping = self.mappings[entity]
+            storage.write_table(
+                pd.DataFrame({'natural_key': mapping.index.to_numpy(), 'key': mapping.to_numpy()}),
+                self.folder, f"{entity}_keys", fmt='parquet',
+            )
+        self.dirty.clear()
+
+
+def output_tables(output):
+    """Tables an output is saved and loaded as"""
+    return COMPACT_TABLES.get(output, [output]) if SURROGATE_KEYS else [output]
+
+
+def transformed_tables(outputs):
+    """Every table the given outputs are saved and loaded as, in order"""
+    return [table for output in outputs for table in output_tables(output)]
+
+
+def _with_key(df, column, keys):
+    df = df.copy(deep=False)
+    df.insert(0, column, keys)
+    return df
+
+
+## Compaction of each output
+def compact_dimension_sets(df, keys):
+    return {'dimension_sets': _with_key(df, 'setKey', keys.keys_for('set', df['setNum']))}
+
+
+def compact_dimension_colors(df, keys):
+    return {'dimension_colors': _with_key(df, 'colorKey', keys.keys_for('color', df['colorId']))}
+
+
+def compact_dimension_parts(df, keys):
+    return {'dimension_parts': _with_key(df, 'partKey', keys.keys_for('part', df['partNumber']))}
+
+
+def compact_ft_inv_minifigs(df, keys):
+    """Minifig facts keep the integer minifig key; the URL moves into dimension_minifigs"""
+    minifig_key = keys.keys_for('minifig', df['fig_num'])
+    facts = pd.DataFrame({
+        'inventory_id': df['inventory_id'].array,
+        'minifig_key': minifig_key,
+        'quantity': df['quantity'].array,
+        'last_modified': df['last_modified'].array,
+    })
+    minifigs = pd.DataFrame({
+        'minifigKey': minifig_key,
+        'figNum': df['fig_num'].array,
+        'setUrl': df['set_url'].array,
+    }).drop_duplicates(subset='minifigKey')
+    return {'ft_inv_minifigs': facts, 'dimension_minifigs': minifigs}
+
+
+def compact_ft_inv_sets(df, keys):
+    """Set facts keep the integer set key; num_parts and the image URL are already in dimension_sets"""
+    return {'ft_inv_sets': pd.DataFrame({
+        'inventory_id': df['inventory_id'].array,
+        'set_key': keys.keys_for('set', df['setnum']),
+        'quantity': df['quantity'].array,
+    })}
+
+
+def compact_ft_inv_parts(df, keys):
+    """Part facts keep integer part and color keys; the image URL (one per part and colour) moves into dimension_part_images"""
+    part_key = keys.keys_for('part', df['part_num_id'])
+    color_key = keys.keys_for('color', df['color_id'])
+    facts = pd.DataFrame({
+        'inventory_id': df['inventory_id'].array,
+        'part_key': part_key,
+        'color_key': color_key,
+        'quantity': df['quantity'].array,
+        'is_spare': df['is_spare'].array,
+    })
+    images = pd.DataFrame({
+        'partKey': part_key,
+        'colorKey': color_key,
+        'imageUrl': df['img_url'].array,
+    }).dropna(subset=['imageUrl']).drop_duplicates(subset=['partKey', 'colorKey'])
+    return {'ft_inv_parts': facts, 'dimension_part_images': images}
+
+
+# Output table -> compaction
+COMPACTORS = {
+    'dimension_sets': compact_dimension_sets,
+    'dimension_colors': compact_dimension_colors,
+    'dimension_parts': compact_dimension_parts,
+    'ft_inv_minifigs': compact_ft_inv_minifigs,
+    'ft_inv_sets': compact_ft_inv_sets,
+    'ft_inv_parts': compact_ft_inv_parts,
+}
+
+
+def compact(output, df, keys):
+    """Split a built output into its compact tables (table name -> DataFrame)"""
+    with keys.locked():
+        tables = COMPACTORS[output](df, keys)
+        # New keys are persisted before any table that uses them is written
+        keys.save()
+    return tables
@@ -0,0 +1,255 @@
+"""Star-schema transformation: raw Rebrickable tables -> fact and dimension tables.
+
+Each output table has its own builder so the transform stage can rebuild only the outputs
+whose inputs changed. Raw tables are loaded lazily and shared intermediates (the inventory
+master datasets) are computed at most once per run.
+"""
+import numpy as np
+import pandas as pd
+
+# Part relationship codes and their descriptions
+REL_TYPE_MAPPING = {
+    'P': 'Print',
+    'R': 'Pair',
+    'B': 'Sub-Part',
+    'M': 'Mold',
+    'T': 'Pattern',
+    'A': 'Alternative'
+}
+
+# Raw columns each output reads (join keys included), per raw table
+_INVENTORY_PARTS_COLUMNS = {
+    'inventory_parts': ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare', 'img_url'],
+    'parts': ['part_num', 'name', 'part_cat_id', 'part_material'],
+    'part_categories': ['id', 'name'],
+    'colors': ['id'],
+    'part_relationships': ['parent_part_num', 'rel_type'],
+}
+OUTPUT_COLUMNS = {
+    'dimension_sets': {'sets': ['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url']},
+    'dimension_colors': {'colors': ['id', 'name', 'rgb', 'is_trans', 'num_parts', 'num_sets', 'y1', 'y2']},
+    'dimension_parts': _INVENTORY_PARTS_COLUMNS,
+    'ft_inv_minifigs': {
+        'inventory_minifigs': ['inventory_id', 'fig_num', 'quantity'],
+        'minifigs': ['set_num', 'set_url', 'last_modified_dt'],
+        'inventories': ['id', 'set_num'],
+        'sets': ['set_num', 'theme_id'],
+        'themes': ['id'],
+    },
+    'ft_inv_sets': {
+        'inventory_sets': ['inventory_id', 'set_num', 'quantity'],
+        'sets': ['set_num', 'num_parts', 'img_url', 'theme_id'],
+        'themes': ['id'],
+    },
+    'ft_inv_parts': _INVENTORY_PARTS_COLUMNS,
+}
+
+# Raw tables each output is built from
+OUTPUT_DEPENDENCIES = {output: list(columns) for output, columns in OUTPUT_COLUMNS.items()}
+
+# Intermediate datasets the source database can pre-join (SQL_PUSHDOWN=joins) -> the raw tables each one stands in for
+PREJOINED_INPUTS = {
+    'part_details': ['parts', 'part_categories'],
+    'part_relationship_summary': ['part_relationships'],
+    'summarized_inventories': ['inventories', 'sets', 'themes'],
+    'inventory_sets_master': ['inventory_sets', 'sets', 'themes'],
+}
+
+
+def required_columns(table):
+    """Columns of a raw table that any output reads, in first-use order (None if no output reads the table)"""
+    columns = [column for tables in OUTPUT_COLUMNS.values() for column in tables.get(table, [])]
+    return list(dict.fromkeys(columns)) or None
+
+
+def output_inputs(output, prejoined=False):
+    """Raw tables an output is built from; with `prejoined`, pre-joined datasets replace the tables they stand in for"""
+    inputs = list(OUTPUT_DEPENDENCIES[output])
+    if prejoined:
+        for name, replaced in PREJOINED_INPUTS.items():
+            if all(table in inputs for table in replaced):
+                inputs = [table for table in inputs if table not in replaced] + [name]
+    return inputs
+
+
+class RawTables:
+    """Loads raw tables on first access and keeps them for the rest of the run.
+
+    `available` names the tables in the raw layer; builders check it for pre-joined datasets.
+    """
+
+    def __init__(self, loader, available=()):
+        self.loader = loader
+        self.available = set(available)
+        self.tables = {}
+
+    def __contains__(self, table):
+        return table in self.available
+
+    def __getitem__(self, table):
+        if table not in self.tables:
+            self.tables[table] = self.loader(table)
+        return self.tables[table]
+
+
+def _shared(cache, name, build):
+    """Compute an intermediate dataset once and reuse it across builders"""
+    if name not in cache:
+        cache[name] = build()
+    return cache[name]
+
+
+## Intermediate datasets
+def summarize_part_relationships(part_relationship_df):
+    """One row per parent part with its relationship codes and descriptions joined into strings.
+
+    Each (parent, code) pair is encoded as one bit of a 6-bit mask; summing the distinct bits per
+    parent is a vectorised groupby, and the at most 63 distinct masks are decoded to strings once.
+    Codes are listed in sorted order, matching a sorted groupby over rel_type. The part numbers keep
+    their dtype, so the merges on them keep theirs.
+    """
+    codes = sorted(REL_TYPE_MAPPING)
+
+    # Integer code per row (-1 for codes outside the mapping and missing values, which are dropped)
+    code_index = pd.Categorical(part_relationship_df['rel_type'], categories=codes).codes
+    valid = (code_index >= 0) & part_relationship_df['parent_part_num'].notna().to_numpy()
+
+    pairs = pd.DataFrame({
+        'parent_part_num': part_relationship_df['parent_part_num'].array[valid],
+        'mask': np.left_shift(1, code_index[valid].astype(np.int64)),
+    }).drop_duplicates()
+    masks = pairs.groupby('parent_part_num', sort=True)['mask'].sum()
+
+    # Decode each distinct mask once
+    rel_type_lookup, rel_type_desc_lookup = {}, {}
+    for mask in masks.unique():
+        mask_codes = [code for i, code in enumerate(codes) if mask >> i & 1]
+        rel_type_lookup[mask] = ', '.join(mask_codes)
+        rel_type_desc_lookup[mask] = ', '.join(REL_TYPE_MAPPING[code] for code in mask_codes)
+
+    return pd.DataFrame({
+        'parent_part_num': masks.index.array,
+        'rel_type': masks.map(rel_type_lookup).to_numpy(),
+        'rel_type_desc': masks.map(rel_type_desc_lookup).to_numpy(),
+    })
+
+
+def part_relationship_summary(raw, cache):
+    """Relationship summary keyed by part number, built once per run and shared by every stage that needs it"""
+    def build():
+        if 'part_relationship_summary' in raw:
+            # Aggregated in the source database
+            return raw['part_relationship_summary'].set_index('parent_part_num')
+        return summarize_part_relationships(raw['part_relationships']).set_index('parent_part_num')
+
+    return _shared(cache, 'part_relationship_summary', build)
+
+
+def summarize_inventories(raw, cache):
+    """Inventories merged with sets and themes"""
+    if 'summarized_inventories' in raw:
+        # Joined in the source database
+        return _shared(cache, 'summarized_inventories', lambda: raw['summarized_inventories'])
+    return _shared(cache, 'summarized_inventories', lambda: (
+        raw['inventories'].rename(columns={'id': 'inventory_id'})
+        .merge(raw['sets'], how='left', on='set_num').rename(columns={'name': 'set_name', 'set_num': 'setnum', 'img_url': 'set_img_url', 'num_parts': 'numparts'})
+        .merge(raw['themes'], how='left', left_on='theme_id', right_on='id').rename(columns={'id': 'themesid', 'name': 'themes_name'})
+    ))
+
+
+def inventory_parts_master(raw, cache):
+    """Master dataset for inventory parts"""
+    def build():
+        if 'part_details' in raw:
+            # Parts already joined with their categories in the source database
+            master = raw['inventory_parts'].merge(raw['part_details'], how='left', on='part_num').rename(columns={'part_num': 'part_num_id'})
+        else:
+            master = (
+                raw['inventory_parts']
+                # .merge(summarized_inventories, how='left', on='inventory_id')   # No direct relationship between these two
+                .merge(raw['parts'], how='left', on='part_num').rename(columns={'part_num': 'part_num_id', 'name': 'part_name'})
+                .merge(raw['part_categories'], how='left', left_on='part_cat_id', right_on='id').rename(columns={'id': 'part_categories_id', 'name': 'part_category_name'})
+            )
+        return (
+            master
+            .merge(raw['colors'], how='left', left_on='color_id', right_on='id')
+            .merge(part_relationship_summary(raw, cache).reset_index(), how='left', left_on='part_num_id', right_on='parent_part_num')
+        )
+
+    return _shared(cache, 'inventory_parts_master', build)
+
+
+def inventory_minifigs_master(raw, cache):
+    """Master dataset for inventory minifigs"""
+    def build():
+        master = (
+            raw['inventory_minifigs']
+            .merge(raw['minifigs'], how='left', left_on='fig_num', right_on='set_num')
+            .merge(summarize_inventories(raw, cache), how='left', on='inventory_id')
+        )
+
+        # Change last_modified_dt from object to Timestamp
+        master['last_modified_dt'] = pd.to_datetime(master['last_modified_dt'])
+        return master
+
+    return _shared(cache, 'inventory_minifigs_master', build)
+
+
+def inventory_sets_master(raw, cache):
+    """Master dataset for inventory sets"""
+    if 'inventory_sets_master' in raw:
+        # Joined in the source database
+        return _shared(cache, 'inventory_sets_master', lambda: raw['inventory_sets_master'])
+    return _shared(cache, 'inventory_sets_master', lambda: (
+        raw['inventory_sets']
+        .merge(raw['sets'], how='left', on='set_num').rename(columns={'name': 'set_name', 'set_num': 'setnum', 'img_url': 'set_img_url', 'num_parts': 'numparts'})
+        .merge(raw['themes'], how='left', left_on='theme_id', right_on='id').rename(columns={'id': 'themesid', 'name': 'themes_name'})
+    ))
+
+
+## Dimensional modeling (facts/dimension tables)
+def build_dimension_sets(raw, cache):
+    """Dimension Sets table"""
+    return raw['sets'][['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url']] \
+        .rename(columns={'set_num': 'setNum', 'name': 'setName', 'theme_id': 'themeId', 'num_parts': 'numParts', 'img_url': 'imageUrl'})
+
+
+def build_dimension_colors(raw, cache):
+    """Dimension Colors table"""
+    return raw['colors'][['id', 'name', 'rgb', 'is_trans', 'num_parts', 'num_sets', 'y1', 'y2']] \
+        .rename(columns={'id': 'colorId', 'name': 'colorName', 'is_trans': 'isTransparent', 'num_parts': 'numParts', 'num_sets': 'numSets', 'y1': 'year1', 'y2': 'year2'}) \
+        .drop_duplicates(subset='colorId')
+
+
+def build_dimension_parts(raw, cache):
+    """Dimension Parts table"""
+    return inventory_parts_master(raw, cache)[['part_name', 'part_num_id', 'part_cat_id', 'part_category_name', 'part_material', 'rel_type', 'rel_type_desc']] \
+        .rename(columns={'part_name': 'partName', 'part_num_id': 'partNumber', 'part_cat_id': 'partCategoryId', 'part_category_name': 'partCategoryName', 'part_material': 'partMaterial', \
+            'rel_type': 'relationshipType', 'rel_type_desc': 'relationshipTypeDesc'}) \
+        .drop_duplicates()
+
+
+def build_ft_inv_minifigs(raw, cache):
+    """Facts inventory minifigs"""
+    return inventory_minifigs_master(raw, cache)[['inventory_id', 'fig_num', 'quantity', 'set_num', 'set_url', 'last_modified_dt']].rename(columns={'last_modified_dt': 'last_modified'})
+
+
+def build_ft_inv_sets(raw, cache):
+    """Facts inventory sets"""
+    return inventory_sets_master(raw, cache)[['inventory_id', 'setnum', 'numparts', 'set_img_url', 'quantity']].rename(columns={'numparts': 'num_parts'})
+
+
+def build_ft_inv_parts(raw, cache):
+    """Facts inventory parts"""
+    return inventory_parts_master(raw, cache)[['inventory_id', 'part_num_id', 'color_id', 'quantity', 'is_spare', 'img_url']]
+
+
+# Output table -> builder
+OUTPUT_BUILDERS = {
+    'dimension_sets': build_dimension_sets,
+    'dimension_colors': build_dimension_colors,
+    'dimension_parts': build_dimension_parts,
+    'ft_inv_minifigs': build_ft_inv_minifigs,
+    'ft_inv_sets': build_ft_inv_sets,
+    'ft_inv_parts': build_ft_inv_parts,
+}
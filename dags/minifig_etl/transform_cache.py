@@ -0,0 +1,89 @@
+"""Fingerprint cache for the transform stage.
+
+Each output is recorded with the content hashes of the raw tables it depends on and a version
+of the transform code. On the next run an output is rebuilt only if its code version changed,
+one of its inputs changed, or the output itself is missing.
+"""
+import hashlib
+import inspect
+import json
+import os
+
+from minifig_etl import join_planner, storage, surrogate_keys, transform, transform_sharded, validation
+
+TRANSFORM_CACHE_FILE = os.getenv("TRANSFORM_CACHE_FILE", "./data/state/transform_cache.json")
+
+
+def fingerprint_path(path):
+    """Content hash of a stored table (a single file, or every part file of a table directory)"""
+    digest = hashlib.blake2b(digest_size=16)
+    files = [path] if os.path.isfile(path) else sorted(
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+    )
+
+    for file_path in files:
+        digest.update(os.path.relpath(file_path, path).encode())
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(engine):
+    """Version of the transform logic: changes whenever the transform modules, table schemas, engine, storage format, key compaction, join planning, sharding or quarantine rules change"""
+    # The schemas set the dtypes the outputs are written with
+    source = inspect.getsource(transform) + repr(sorted(storage.TABLE_SCHEMAS.items())) + engine + storage.STORAGE_FORMAT
+    if surrogate_keys.SURROGATE_KEYS:
+        source += inspect.getsource(surrogate_keys)
+    if join_planner.JOIN_PLANNER and engine != 'duckdb':
+        source += inspect.getsource(join_planner)
+    if validation.DATA_VALIDATION == 'quarantine':
+        # Quarantined rows do not reach the outputs
+        source += inspect.getsource(validation)
+    if engine == 'duckdb':
+        from minifig_etl import transform_duckdb
+        source += inspect.getsource(transform_duckdb)
+    elif transform_sharded.TRANSFORM_SHARDS > 1:
+        source += inspect.getsource(transform_sharded)
+    return hashlib.blake2b(source.encode(), digest_size=16).hexdigest()
+
+
+def load_manifest():
+    if not os.path.exists(TRANSFORM_CACHE_FILE):
+        return {}
+    with open(TRANSFORM_CACHE_FILE) as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest, outputs):
+    """Persist the entries of `outputs`, keeping the entries other tasks have saved in the meantime"""
+    with storage.file_lock(TRANSFORM_CACHE_FILE):
+        stored = load_manifest()
+        stored.update({output: manifest[output] for output in outputs})
+        tmp_path = f"{TRANSFORM_CACHE_FILE}.tmp"
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump(stored, manifest_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, TRANSFORM_CACHE_FILE)
+
+
+def stale_outputs(manifest, fingerprints, version, transformed_dir, dependencies):
+    """Outputs (of `dependencies`: output -> raw input tables) whose code version, input fingerprints or on-disk table no longer match the manifest"""
+    stale = []
+    for output, inputs in dependencies.items():
+        entry = manifest.get(output)
+        if (
+            entry is None
+            or entry['code_version'] != version
+            or entry['inputs'] != {table: fingerprints[table] for table in inputs}
+            or not all(storage.table_exists(transformed_dir, table) for table in surrogate_keys.output_tables(output))
+        ):
+            stale.append(output)
+    return stale
+
+
+def record_output(manifest, output, inputs, fingerprints, version):
+    """Remember the inputs an output was built from"""
+    manifest[output] = {
+        'code_version': version,
+        'inputs': {table: fingerprints[table] for table in inputs},
+    }
@@ -0,0 +1,154 @@
+"""DuckDB transform engine: the star-schema logic of `transform.py` as SQL over the raw files.
+
+Raw tables are exposed as views over the stored files, so DuckDB reads only the columns each
+query needs (projection pushdown), runs joins and aggregations on all cores, and spills to
+disk instead of failing when a join outgrows the memory limit. Outputs match the pandas
+engine row for row; only row order may differ.
+"""
+import os
+
+import duckdb
+import pyarrow.dataset as ds
+
+from minifig_etl import storage
+from minifig_etl.transform import REL_TYPE_MAPPING
+
+# Optional DuckDB resource settings (DuckDB defaults: 80% of RAM and one thread per core)
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT")
+DUCKDB_THREADS = os.getenv("DUCKDB_THREADS")
+DUCKDB_TEMP_DIRECTORY = os.getenv("DUCKDB_TEMP_DIRECTORY", "./data/state/duckdb_tmp")
+
+# Small tables an output de-duplicates keeping the first row per key, as pandas' drop_duplicates does.
+# They are copied into DuckDB tables in stored row order, so `rowid` is each row's position.
+ORDERED_TABLES = ['colors']
+
+
+class RawViews:
+    """A DuckDB connection with one lazy view per raw table"""
+
+    def __init__(self, table_paths):
+        self.con = duckdb.connect()
+        self.con.execute("SET TimeZone = 'UTC'")
+        self.con.execute(f"SET temp_directory = '{DUCKDB_TEMP_DIRECTORY}'")
+        if DUCKDB_MEMORY_LIMIT:
+            self.con.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+        if DUCKDB_THREADS:
+            self.con.execute(f"SET threads = {int(DUCKDB_THREADS)}")
+
+        for table, path in table_paths.items():
+            # Ordered tables are scanned under another name and copied into a table of their own below
+            scan = f"_{table}_files" if table in ORDERED_TABLES else table
+            if storage.STORAGE_FORMAT == 'parquet':
+                self.con.execute(f"CREATE VIEW {scan} AS SELECT * FROM read_parquet('{path}/*.parquet')")
+            elif storage.STORAGE_FORMAT == 'arrow':
+                # DuckDB scans the Arrow dataset lazily, pushing column selection down to the IPC files
+                self.con.register(scan, ds.dataset(path, format='ipc'))
+            else:
+                self.con.execute(f"CREATE VIEW {scan} AS SELECT * FROM read_csv_auto('{path}')")
+
+            if scan != table:
+                # Insertion order is preserved (DuckDB's default), so the copy keeps the stored row order
+                self.con.execute(f"CREATE TABLE {table} AS SELECT * FROM {scan}")
+
+    def query(self, sql):
+        return self.con.execute(sql).df()
+
+    def close(self):
+        self.con.close()
+
+
+_REL_TYPE_DESC = "CASE rel_type " + " ".join(
+    f"WHEN '{code}' THEN '{desc}'" for code, desc in REL_TYPE_MAPPING.items()
+) + " END"
+
+## Intermediate datasets (CTEs shared by several outputs)
+# One row per parent part; codes joined in sorted order like the pandas groupby
+SUMMARIZED_PART_RELATIONSHIPS = f"""
+summarized_part_relationships AS (
+    SELECT
+        parent_part_num,
+        string_agg(rel_type, ', ' ORDER BY rel_type, rel_type_desc) AS rel_type,
+        string_agg(rel_type_desc, ', ' ORDER BY rel_type, rel_type_desc) AS rel_type_desc
+    FROM (
+        SELECT DISTINCT parent_part_num, CAST(rel_type AS VARCHAR) AS rel_type, {_REL_TYPE_DESC} AS rel_type_desc
+        FROM part_relationships
+    ) pairs
+    WHERE parent_part_num IS NOT NULL AND rel_type IS NOT NULL AND rel_type_desc IS NOT NULL
+    GROUP BY parent_part_num
+)"""
+
+# Master dataset for inventory parts (only the columns the outputs use). Joins whose columns are not
+# selected stay in so duplicate keys fan out rows exactly as the pandas merges do.
+INVENTORY_PARTS_MASTER = f"""
+WITH {SUMMARIZED_PART_RELATIONSHIPS},
+inventory_parts_master AS (
+    SELECT
+        ip.inventory_id, ip.part_num AS part_num_id, ip.color_id, ip.quantity, ip.is_spare, ip.img_url,
+        p.name AS part_name, p.part_cat_id, CAST(p.part_material AS VARCHAR) AS part_material,
+        pc.name AS part_category_name,
+        r.rel_type, r.rel_type_desc
+    FROM inventory_parts ip
+    LEFT JOIN parts p ON p.part_num = ip.part_num
+    LEFT JOIN part_categories pc ON pc.id = p.part_cat_id
+    LEFT JOIN colors c ON c.id = ip.color_id
+    LEFT JOIN summarized_part_relationships r ON r.parent_part_num = ip.part_num
+)"""
+
+# Inventories merged with sets and themes
+SUMMARIZED_INVENTORIES = """
+summarized_inventories AS (
+    SELECT i.id AS inventory_id
+    FROM inventories i
+    LEFT JOIN sets s ON s.set_num = i.set_num
+    LEFT JOIN themes t ON t.id = s.theme_id
+)"""
+
+## Dimensional modeling (facts/dimension tables)
+OUTPUT_QUERIES = {
+    'dimension_sets': """
+        SELECT set_num AS "setNum", name AS "setName", year, theme_id AS "themeId", num_parts AS "numParts", img_url AS "imageUrl"
+        FROM sets
+    """,
+    'dimension_colors': """
+        SELECT DISTINCT ON (id)
+            id AS "colorId", name AS "colorName", rgb, is_trans AS "isTransparent", num_parts AS "numParts",
+            num_sets AS "numSets", y1 AS year1, y2 AS year2
+        FROM colors
+        ORDER BY id, rowid   -- The first stored row per id, as pandas keeps
+    """,
+    'dimension_parts': INVENTORY_PARTS_MASTER + """
+        SELECT DISTINCT
+            part_name AS "partName", part_num_id AS "partNumber", part_cat_id AS "partCategoryId",
+            part_category_name AS "partCategoryName", part_material AS "partMaterial",
+            rel_type AS "relationshipType", rel_type_desc AS "relationshipTypeDesc"
+        FROM inventory_parts_master
+    """,
+    'ft_inv_minifigs': f"""
+        WITH {SUMMARIZED_INVENTORIES.strip()}
+        SELECT im.inventory_id, im.fig_num, im.quantity, m.set_num, m.set_url, m.last_modified_dt AS last_modified
+        FROM inventory_minifigs im
+        LEFT JOIN minifigs m ON m.set_num = im.fig_num
+        LEFT JOIN summarized_inventories si ON si.inventory_id = im.inventory_id
+    """,
+    'ft_inv_sets': """
+        SELECT iset.inventory_id, iset.set_num AS setnum, s.num_parts, s.img_url AS set_img_url, iset.quantity
+        FROM inventory_sets iset
+        LEFT JOIN sets s ON s.set_num = iset.set_num
+        LEFT JOIN themes t ON t.id = s.theme_id
+    """,
+    'ft_inv_parts': INVENTORY_PARTS_MASTER + """
+        SELECT inventory_id, part_num_id, color_id, quantity, is_spare, img_url
+        FROM inventory_parts_master
+    """,
+}
+
+
+def _builder(output):
+    def build(raw, cache):
+        return raw.query(OUTPUT_QUERIES[output])
+    build.__doc__ = f"Build {output} with DuckDB"
+    return build
+
+
+# Output table -> builder (same interface as transform.OUTPUT_BUILDERS)
+OUTPUT_BUILDERS = {output: _builder(output) for output in OUTPUT_QUERIES}
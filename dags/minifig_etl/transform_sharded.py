@@ -0,0 +1,154 @@
+"""Sharded, multi-process build of dimension_parts and ft_inv_parts (pandas engine).
+
+`inventory_parts` is hash-partitioned by inventory_id into TRANSFORM_SHARDS shard tables,
+reading the raw table in batches so it is never held in memory whole. The small lookups
+(parts, part_categories, colors and the part relationship summary) are sent to each worker
+of a process pool once, when the worker starts. Each worker runs the usual builders
+(transform.build_dimension_parts / build_ft_inv_parts, or the join_planner ones) over one
+shard at a time and writes its facts as one part file of ft_inv_parts, so memory per worker
+is bounded by the shard size. The partial dimension_parts of every shard are combined and
+de-duplicated in the parent.
+
+Row order differs from the single-process build (rows are grouped by shard, in shard order); the content is the same.
+"""
+import os
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from minifig_etl import instrumentation, join_planner, storage, surrogate_keys, transform
+
+# Number of inventory_id shards; 0 or 1 keeps the single-process build
+TRANSFORM_SHARDS = int(os.getenv("TRANSFORM_SHARDS", "0"))
+# Worker processes (at most one per shard)
+TRANSFORM_SHARD_WORKERS = int(os.getenv("TRANSFORM_SHARD_WORKERS", str(os.cpu_count() or 1)))
+# Scratch folder for the partitioned inventory_parts (removed after the build)
+TRANSFORM_SHARD_DIR = os.getenv("TRANSFORM_SHARD_DIR", "./data/state/shards")
+TRANSFORM_SHARD_BATCH_SIZE = int(os.getenv("TRANSFORM_SHARD_BATCH_SIZE", "250000"))
+
+# Outputs built from the inventory_parts master
+SHARDED_OUTPUTS = ['dimension_parts', 'ft_inv_parts']
+# Lookups broadcast to the workers (part_details replaces parts and part_categories with SQL_PUSHDOWN=joins)
+LOOKUP_TABLES = ['parts', 'part_categories', 'part_details', 'colors']
+
+_broadcast = {}   # Lookups of this worker process, set once by _init_worker
+
+
+def shard_of(inventory_ids, shards):
+    """Shard number of each inventory_id (a stable hash, so the same inventory always lands in the same shard)"""
+    ids = pd.Series(inventory_ids).astype('Int64').fillna(-1).to_numpy(dtype='int64')
+    return pd.util.hash_array(ids) % shards
+
+
+def partition_inventory_parts(source_folder, shard_dir, shards, batch_size, validator=None):
+    """Split the raw inventory_parts table into `shard_dir/shard-<n>` tables; returns (rows, part numbers, color ids)"""
+    rows, part_nums, color_ids = 0, set(), set()
+    for batch in storage.iter_batches(source_folder, 'inventory_parts', batch_size):
+        if validator is not None:
+            # Checked batch by batch as it streams into the shards
+            batch = validator.check(batch)
+        shard_ids = shard_of(batch['inventory_id'], shards)
+        # Every shard gets a part for every batch (possibly empty), so each shard table exists with the full schema
+        for shard in range(shards):
+            storage.write_table(batch[shard_ids == shard], shard_folder(shard_dir, shard), 'inventory_parts', append=True)
+        rows += len(batch)
+        part_nums.update(batch['part_num'].dropna())
+        color_ids.update(batch['color_id'].dropna())
+    return rows, part_nums, color_ids
+
+
+def shard_folder(shard_dir, shard):
+    return os.path.join(shard_dir, f"shard-{shard:05d}")
+
+
+def _init_worker(lookups, summary, key_mappings):
+    _broadcast.update(lookups=lookups, summary=summary, key_mappings=key_mappings)
+
+
+def _build_shard(shard, shard_dir, transformed_dir, fmt):
+    """Build one shard's facts (written to disk) and its partial dimension_parts / dimension_part_images"""
+    raw = dict(_broadcast['lookups'], inventory_parts=storage.read_table(shard_folder(shard_dir, shard), 'inventory_parts', fmt=fmt))
+    cache = {'part_relationship_summary': _broadcast['summary']}
+    builders = join_planner.output_builders()
+    parts = builders['dimension_parts'](raw, cache)
+    facts = builders['ft_inv_parts'](raw, cache)
+
+    images = None
+    if _broadcast['key_mappings'] is not None:
+        # Every part and colour already has its key, so the worker's copy of the key store is read-only
+        keys = surrogate_keys.KeyStore()
+        keys.mappings = dict(_broadcast['key_mappings'])
+        compacted = surrogate_keys.COMPACTORS['ft_inv_parts'](facts, keys)
+        facts, images = compacted['ft_inv_parts'], compacted['dimension_part_images']
+
+    if fmt == 'csv':
+        # A CSV table is a single file, so the parent appends the shards in order
+        storage.write_table(facts, shard_folder(shard_dir, shard), 'ft_inv_parts', fmt=fmt)
+    else:
+        storage.write_part(facts, transformed_dir, 'ft_inv_parts', shard, fmt=fmt)
+    return parts, images, len(facts)
+
+
+def build_inventory_parts(raw, cache, source_folder, transformed_dir, key_store=None, validator=None):
+    """Build both SHARDED_OUTPUTS; returns output -> {table: DataFrame}.
+
+    ft_inv_parts is written to `transformed_dir` by the workers and is returned as None.
+    `validator` (a validation.Validator) checks inventory_parts while it is partitioned.
+    """
+    shards, workers = TRANSFORM_SHARDS, TRANSFORM_SHARD_WORKERS
+    fmt = storage.STORAGE_FORMAT
+    shard_dir = os.path.join(TRANSFORM_SHARD_DIR, 'inventory_parts')
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+    with instrumentation.span('partition', table='inventory_parts', shards=shards) as step:
+        rows, part_nums, color_ids = partition_inventory_parts(source_folder, shard_dir, shards, TRANSFORM_SHARD_BATCH_SIZE, validator)
+        step.add(rows_in=rows)
+        if validator is not None:
+            validator.finish()
+    print(f"Partitioned {rows} inventory_parts rows into {shards} shards")
+
+    key_mappings = None
+    if key_store is not None:
+        # Assign keys up front (sorted, as the single-process build would) so workers never mint keys
+        with key_store.locked():
+            key_store.keys_for('part', sorted(part_nums))
+            key_store.keys_for('color', sorted(color_ids))
+            key_store.save()
+            key_mappings = {entity: key_store.mapping(entity) for entity in ('part', 'color')}
+
+    lookups = {table: raw[table] for table in LOOKUP_TABLES if table in raw}
+    summary = transform.part_relationship_summary(raw, cache)
+    storage.delete_table(transformed_dir, 'ft_inv_parts')
+
+    # Spawned rather than forked: the fused mode's loader thread may be running in this process
+    # Results are kept by shard and combined in shard order, so the rows kept by the de-duplication
+    # (and the row order) do not depend on which worker finishes first
+    results, fact_rows = [None] * shards, 0
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, shards)), mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(lookups, summary, key_mappings)) as pool:
+        futures = {pool.submit(_build_shard, shard, shard_dir, transformed_dir, fmt): shard for shard in range(shards)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            fact_rows += results[futures[future]][2]
+    partial_parts = [parts for parts, _, _ in results]
+    partial_images = [images for _, images, _ in results if images is not None]
+
+    if fmt == 'csv':
+        for shard in range(shards):
+            facts = storage.read_table(shard_folder(shard_dir, shard), 'ft_inv_parts', fmt=fmt)
+            storage.write_table(facts, transformed_dir, 'ft_inv_parts', fmt=fmt, append=shard > 0)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    print(f"Built ft_inv_parts from {shards} shards ({fact_rows} rows)")
+
+    dimension_parts = pd.concat(partial_parts, ignore_index=True).drop_duplicates()
+    tables = {
+        'dimension_parts': surrogate_keys.compact('dimension_parts', dimension_parts, key_store) if key_store else {'dimension_parts': dimension_parts},
+        'ft_inv_parts': {'ft_inv_parts': None},
+    }
+    if partial_images:
+        tables['ft_inv_parts']['dimension_part_images'] = (
+            pd.concat(partial_images, ignore_index=True).drop_duplicates(subset=['partKey', 'colorKey'])
+        )
+    return tables
@@ -0,0 +1,188 @@
+"""Inline data-quality checks for the extract and transform stages (DATA_VALIDATION).
+
+A `Validator` checks a table chunk by chunk as it is written or loaded, so no table needs a second
+pass; a table loaded whole is checked in chunks too (`check_table`). The checks are declared per raw table in TABLE_RULES and run vectorised:
+- key uniqueness: key hashes are looked up in a sorted array of the keys seen in earlier chunks
+- not-null columns, and per-chunk null-rate limits
+- referential integrity: child keys are looked up in the hash set of the parent table's keys
+- join cardinality: the extra rows an N:1 lookup join would produce from duplicate parent keys
+
+In 'report' mode violations are only counted. In 'quarantine' mode the offending rows (or the
+chunk, for a null-rate breach) are written to QUARANTINE_DIR/<stage>/<table> with a `violation`
+column and the rest of the data flows on; the run fails only once more than QUARANTINE_MAX_SHARE
+of a table is quarantined. Counts and the time spent checking are recorded on the enclosing
+instrumentation span.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from minifig_etl import instrumentation, storage
+
+# 'off', 'report' (count violations) or 'quarantine' (also divert the offending rows)
+DATA_VALIDATION = os.getenv("DATA_VALIDATION", "off")
+QUARANTINE_DIR = os.getenv("QUARANTINE_DIR", "./data/quarantine")
+# Largest share of a table's rows that may be quarantined before the run fails
+QUARANTINE_MAX_SHARE = float(os.getenv("QUARANTINE_MAX_SHARE", "0.5"))
+
+# Checks per raw table:
+#   key            - columns that identify a row (unique and not null)
+#   not_null       - columns that must always be set
+#   max_null_rate  - column -> largest share of nulls a chunk may have
+#   references     - column -> (parent table, parent column) the value must exist in; the join on it is N:1
+TABLE_RULES = {
+    'colors': {'key': ['id'], 'max_null_rate': {'name': 0.01, 'rgb': 0.01}},
+    'parts': {'key': ['part_num'], 'max_null_rate': {'name': 0.01}, 'references': {'part_cat_id': ('part_categories', 'id')}},
+    'part_categories': {'key': ['id']},
+    'part_relationships': {
+        'not_null': ['parent_part_num', 'rel_type'],
+        'references': {'parent_part_num': ('parts', 'part_num'), 'child_part_num': ('parts', 'part_num')},
+    },
+    'sets': {'key': ['set_num'], 'max_null_rate': {'name': 0.01}, 'references': {'theme_id': ('themes', 'id')}},
+    'themes': {'key': ['id']},
+    'inventories': {'key': ['id']},   # set_num also holds minifig numbers, so it has no single parent table
+    'inventory_parts': {
+        'not_null': ['inventory_id', 'part_num', 'color_id', 'quantity'],
+        'references': {'inventory_id': ('inventories', 'id'), 'part_num': ('parts', 'part_num'), 'color_id': ('colors', 'id')},
+    },
+    'inventory_sets': {
+        'key': ['inventory_id', 'set_num'],
+        'references': {'inventory_id': ('inventories', 'id'), 'set_num': ('sets', 'set_num')},
+    },
+    'inventory_minifigs': {
+        'key': ['inventory_id', 'fig_num'],
+        'references': {'inventory_id': ('inventories', 'id'), 'fig_num': ('minifigs', 'set_num')},
+    },
+    'minifigs': {'key': ['set_num']},
+
+    # Pre-joined raw datasets (SQL_PUSHDOWN=joins)
+    'part_details': {'key': ['part_num']},
+    'part_relationship_summary': {'key': ['parent_part_num']},
+    'summarized_inventories': {'not_null': ['inventory_id']},
+}
+
+
+def enabled():
+    return DATA_VALIDATION in ('report', 'quarantine')
+
+
+def with_reference_parents(tables, available):
+    """`tables` plus the parents (among `available`) their reference checks read, and the parents of those"""
+    tables = list(tables)
+    for table in tables:   # Parents appended here are expanded in turn
+        for parent, _ in TABLE_RULES.get(table, {}).get('references', {}).values():
+            if parent in available and parent not in tables:
+                tables.append(parent)
+    return tables
+
+
+class Validator:
+    """Checks one table chunk by chunk; `check` returns the chunk without the rows that are quarantined.
+
+    `parents` maps a parent table to its DataFrame for the reference checks; references whose parent
+    is not given are skipped (during extraction the parents may not have been extracted yet).
+    """
+
+    def __init__(self, table, stage, parents=None):
+        self.table = table
+        self.stage = stage
+        self.rules = TABLE_RULES.get(table, {})
+        self.quarantine = DATA_VALIDATION == 'quarantine'
+        self.seen_keys = np.array([], dtype=np.uint64)
+        self.counts = {'validated_rows': 0, 'quarantined_rows': 0}
+        self.seconds = 0.0
+        self.quarantine_folder = os.path.join(QUARANTINE_DIR, stage)
+        if self.quarantine:
+            # The quarantine holds the rows rejected by the latest check of the table
+            with storage.file_lock(storage.table_path(self.quarantine_folder, table)):
+                storage.delete_table(self.quarantine_folder, table)
+
+        # Parent key hash sets, plus the duplicate parent keys that would fan out an N:1 join
+        self.references = {}
+        for column, (parent, parent_column) in self.rules.get('references', {}).items():
+            if parents is None or parent not in parents:
+                continue
+            parent_keys = parents[parent][parent_column].dropna()
+            key_counts = parent_keys.value_counts()
+            self.references[column] = (pd.Index(key_counts.index), key_counts[key_counts > 1] - 1)
+
+    def _count(self, check, violations):
+        found = int(violations.sum())
+        if found:
+            self.counts[check] = self.counts.get(check, 0) + found
+        return found
+
+    def check(self, chunk):
+        start = time.perf_counter()
+        # Name of the first failed check per row ('' for clean rows)
+        violation = np.full(len(chunk), '', dtype=object)
+
+        def flag(check, mask):
+            mask = np.asarray(mask, dtype=bool)
+            if self._count(check, mask):
+                violation[mask & (violation == '')] = check
+
+        key = [column for column in self.rules.get('key', []) if column in chunk]
+        if key:
+            null_key = chunk[key].isna().any(axis=1).to_numpy()
+            flag('null_key', null_key)
+            # Typed first, so a key hashes the same in every chunk whatever dtype the chunk was read with
+            hashes = pd.util.hash_pandas_object(storage.apply_schema(chunk[key].copy(), self.table), index=False).to_numpy()
+            # Repeated within the chunk, or already seen in an earlier one
+            duplicate = pd.Series(hashes).duplicated().to_numpy() | np.isin(hashes, self.seen_keys)
+            flag('duplicate_key', duplicate & ~null_key)
+            self.seen_keys = np.union1d(self.seen_keys, hashes[~duplicate & ~null_key])
+
+        not_null = [column for column in self.rules.get('not_null', []) if column in chunk]
+        if not_null:
+            flag('null_value', chunk[not_null].isna().any(axis=1).to_numpy())
+
+        for column, (parent_keys, extra_rows) in self.references.items():
+            if column not in chunk:
+                continue
+            values = chunk[column]
+            flag(f"orphan_{column}", (values.notna() & ~values.isin(parent_keys)).to_numpy())
+            if len(extra_rows):
+                self.counts['fanout_rows'] = self.counts.get('fanout_rows', 0) + int(values.map(extra_rows).fillna(0).sum())
+
+        # A null-rate breach points at a broken chunk rather than a bad row
+        for column, limit in self.rules.get('max_null_rate', {}).items():
+            if column in chunk and len(chunk) and chunk[column].isna().mean() > limit:
+                self.counts['null_rate_chunks'] = self.counts.get('null_rate_chunks', 0) + 1
+                violation[violation == ''] = f"null_rate_{column}"
+
+        bad = violation != ''
+        self.counts['validated_rows'] += len(chunk)
+        if self.quarantine and bad.any():
+            self._write_quarantine(chunk[bad].assign(violation=violation[bad]))
+            self.counts['quarantined_rows'] += int(bad.sum())
+            chunk = chunk[~bad]
+
+        self.seconds += time.perf_counter() - start
+        return chunk
+
+    def check_table(self, df, chunk_size):
+        """`check` a whole table in chunks of `chunk_size` rows, as extraction checks it, so a null-rate breach quarantines one chunk"""
+        chunks = [self.check(df.iloc[start:start + chunk_size]) for start in range(0, max(len(df), 1), chunk_size)]
+        return chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+
+    def _write_quarantine(self, rows):
+        # Tasks checking the same table write to the same place; the lock keeps their part files apart
+        with storage.file_lock(storage.table_path(self.quarantine_folder, self.table)):
+            storage.write_table(rows, self.quarantine_folder, self.table, append=True)
+
+    def finish(self):
+        """Record the counts and the time spent checking on the current span, and return them"""
+        report = dict(self.counts, validation_s=round(self.seconds, 3))
+        instrumentation.record(**report)
+        violations = {check: count for check, count in self.counts.items() if check not in ('validated_rows', 'quarantined_rows')}
+        if violations:
+            print(f"Validation of {self.table} ({self.stage}): {violations}, {self.counts['quarantined_rows']} rows quarantined "
+                  f"({self.seconds:.2f}s)")
+        # A few bad chunks are diverted; a table that would mostly disappear stops the run instead
+        if self.counts['quarantined_rows'] > QUARANTINE_MAX_SHARE * self.counts['validated_rows']:
+            raise ValueError(f"{self.counts['quarantined_rows']} of the {self.counts['validated_rows']} rows of {self.table} ({self.stage}) "
+                             f"were quarantined, more than QUARANTINE_MAX_SHARE={QUARANTINE_MAX_SHARE}; see {self.quarantine_folder}")
+        return report
@@ -0,0 +1,154 @@
+"""Loaders for the analytics warehouse (PostgreSQL).
+
+`copy_frame_to_table` replaces a table with a bulk COPY. `merge_frame_into_table` keeps the
+target and its indexes in place: the frame is COPYed into a staging table, then upserted on the
+table's natural key, and rows that disappeared from the snapshot are deleted, all in one
+transaction, so BI queries keep seeing the previous version until the commit.
+"""
+import io
+import os
+
+WAREHOUSE_LOAD_CHUNK_SIZE = int(os.getenv("WAREHOUSE_LOAD_CHUNK_SIZE", "100000"))
+# Merge mode, rows that share a natural key but differ: 'first' keeps the first in snapshot order (and reports
+# the rest), 'fail' stops the load
+WAREHOUSE_DUPLICATE_KEYS = os.getenv("WAREHOUSE_DUPLICATE_KEYS", "first")
+
+# Natural key of each warehouse table (is_spare is part of the inventory parts key: the same
+# part and colour can appear in an inventory both as a regular and as a spare part)
+NATURAL_KEYS = {
+    'sets_dim': ['setNum'],
+    'colors_dim': ['colorId'],
+    'parts_dim': ['partNumber'],
+    'inventory_minifigs_ft': ['inventory_id', 'fig_num'],
+    'inventory_sets_ft': ['inventory_id', 'setnum'],
+    'inventory_parts_ft': ['inventory_id', 'part_num_id', 'color_id', 'is_spare'],
+}
+
+# Keys of the compact tables written with SURROGATE_KEYS (used when the frame carries these columns)
+SURROGATE_NATURAL_KEYS = {
+    'minifigs_dim': ['figNum'],
+    'part_images_dim': ['partKey', 'colorKey'],
+    'inventory_minifigs_ft': ['inventory_id', 'minifig_key'],
+    'inventory_sets_ft': ['inventory_id', 'set_key'],
+    'inventory_parts_ft': ['inventory_id', 'part_key', 'color_key', 'is_spare'],
+}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _copy_rows(cursor, df, table_name, chunk_size=WAREHOUSE_LOAD_CHUNK_SIZE):
+    """Stream the rows of `df` into an existing table with COPY ... FROM STDIN, one buffered chunk at a time"""
+    column_list = ', '.join(_quote(col) for col in df.columns)
+    copy_sql = f'COPY {table_name} ({column_list}) FROM STDIN WITH (FORMAT csv)'
+
+    # Serialise one chunk at a time so the buffer stays small for large fact tables
+    for start in range(0, len(df), chunk_size):
+        buffer = io.StringIO()
+        df.iloc[start:start + chunk_size].to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+
+
+def copy_frame_to_table(engine, df, table_name, chunk_size=WAREHOUSE_LOAD_CHUNK_SIZE):
+    """Replace `table_name` with the contents of `df` using COPY ... FROM STDIN, streamed through an in-memory buffer"""
+    # Table creation and COPY share one transaction, so readers never see a half-loaded table
+    with engine.begin() as conn:
+        # Create the empty target table with column types derived from the DataFrame dtypes
+        df.head(0).to_sql(table_name, con=conn, if_exists='replace', index=False)
+
+        cursor = conn.connection.cursor()
+        try:
+            _copy_rows(cursor, df, _quote(table_name), chunk_size)
+        finally:
+            cursor.close()
+
+
+def deduplicate_keys(df, key_columns, table_name, on_conflict=None):
+    """Reduce `df` to one row per natural key: exact duplicate rows are dropped, and rows that share a key
+    but differ are resolved by WAREHOUSE_DUPLICATE_KEYS ('first' keeps the first in frame order, 'fail' raises)"""
+    on_conflict = on_conflict or WAREHOUSE_DUPLICATE_KEYS
+    repeated = df.duplicated(subset=key_columns, keep='first')
+    if not repeated.any():
+        return df
+
+    identical = df.duplicated(keep='first')
+    conflicts = int((repeated & ~identical).sum())
+    if conflicts:
+        sample = df.loc[repeated & ~identical, key_columns].head(5).to_dict('records')
+        message = (f"{table_name}: {conflicts} rows share a natural key ({', '.join(key_columns)}) with an earlier, "
+                   f"different row, e.g. {sample}")
+        if on_conflict == 'fail':
+            raise ValueError(message)
+        print(f"{message}; keeping the first row per key")
+    if int(identical.sum()):
+        print(f"{table_name}: dropping {int(identical.sum())} exact duplicate rows")
+    return df[~repeated]
+
+
+def merge_frame_into_table(engine, df, table_name, key_columns=None, chunk_size=WAREHOUSE_LOAD_CHUNK_SIZE):
+    """Make `table_name` match the snapshot in `df`, writing only inserted, changed and deleted rows"""
+    if key_columns is None:
+        surrogate_key = SURROGATE_NATURAL_KEYS.get(table_name, [])
+        key_columns = surrogate_key if surrogate_key and set(surrogate_key) <= set(df.columns) else NATURAL_KEYS[table_name]
+    target = _quote(table_name)
+    staging = _quote(f"{table_name}__staging")
+    columns = ', '.join(_quote(col) for col in df.columns)
+    keys = ', '.join(_quote(col) for col in key_columns)
+    value_columns = [col for col in df.columns if col not in key_columns]
+
+    # Rows without a complete natural key cannot be matched between runs
+    missing_key = df[key_columns].isna().any(axis=1)
+    if missing_key.any():
+        print(f"{table_name}: skipping {int(missing_key.sum())} rows with a missing natural key")
+        df = df[~missing_key]
+    # The upsert needs one row per key; which one survives must not depend on how Postgres reads the staging table
+    df = deduplicate_keys(df, key_columns, table_name)
+
+    with engine.begin() as conn:
+        # First load: create the target from the frame's dtypes with a unique index on the natural key
+        if not engine.dialect.has_table(conn, table_name):
+            df.head(0).to_sql(table_name, con=conn, if_exists='fail', index=False)
+        index_name = _quote(table_name + '_natural_key')
+        if conn.exec_driver_sql("SELECT to_regclass(%s) IS NULL", (index_name,)).scalar():
+            # A table loaded by another mode may repeat keys, which the unique index would reject. The merge replaces
+            # its content with the snapshot anyway, so only one row per key is kept (its values are upserted below).
+            key_match = ' AND '.join(f"d.{_quote(col)} = t.{_quote(col)}" for col in key_columns)
+            removed = conn.exec_driver_sql(f"DELETE FROM {target} t USING {target} d WHERE {key_match} AND t.ctid > d.ctid").rowcount
+            if removed:
+                print(f"{table_name}: removed {removed} rows with a repeated natural key before indexing it")
+            conn.exec_driver_sql(f"CREATE UNIQUE INDEX {index_name} ON {target} ({keys})")
+
+        # Temporary tables are never WAL-logged and disappear with the transaction
+        conn.exec_driver_sql(f"CREATE TEMP TABLE {staging} (LIKE {target}) ON COMMIT DROP")
+
+        cursor = conn.connection.cursor()
+        try:
+            _copy_rows(cursor, df, staging, chunk_size)
+        finally:
+            cursor.close()
+
+        # Upsert; unchanged rows are filtered out so they are not rewritten
+        if value_columns:
+            updates = ', '.join(f"{_quote(col)} = EXCLUDED.{_quote(col)}" for col in value_columns)
+            current = ', '.join(f"{target}.{_quote(col)}" for col in value_columns)
+            incoming = ', '.join(f"EXCLUDED.{_quote(col)}" for col in value_columns)
+            on_conflict = f"DO UPDATE SET {updates} WHERE ({current}) IS DISTINCT FROM ({incoming})"
+        else:
+            on_conflict = "DO NOTHING"
+
+        upserted = conn.exec_driver_sql(
+            f"INSERT INTO {target} ({columns}) "
+            f"SELECT {columns} FROM {staging} "
+            f"ON CONFLICT ({keys}) {on_conflict}"
+        ).rowcount
+
+        # Rows that are no longer in the snapshot
+        key_match = ' AND '.join(f"s.{_quote(col)} = t.{_quote(col)}" for col in key_columns)
+        deleted = conn.exec_driver_sql(
+            f"DELETE FROM {target} t WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE {key_match})"
+        ).rowcount
+
+    print(f"{table_name}: {upserted} rows inserted or updated, {deleted} rows deleted")
+    return upserted, deleted
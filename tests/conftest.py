@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Make the DAG modules and the benchmark helpers (synthetic data, stub API) importable
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [os.path.join(ROOT, 'dags'), os.path.join(ROOT, 'benchmarks')]
@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import aiohttp
+import pytest
+
+from minifig_etl import api_client
+from pipeline import start_stub_api
+
+PAGE_SIZE = 10
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def stub():
+    stub = start_stub_api(free_port(), PAGE_SIZE)
+    stub['records'] = [{'set_num': f"fig-{i:06d}", 'name': f"Minifig {i}"} for i in range(95)]
+    return stub
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    monkeypatch.setattr(api_client, 'API_RATE_LIMIT', 1000)
+    monkeypatch.setattr(api_client, 'API_RATE_BURST', 1000)
+    monkeypatch.setattr(api_client, 'API_BACKOFF_BASE', 0.01)
+
+
+@pytest.fixture
+def errors(stub):
+    """Responses the stub sends before serving pages again"""
+    yield stub['errors']
+    stub['errors'].clear()
+
+
+def stored_records(page_store):
+    return list(itertools.chain.from_iterable(page_store.iter_pages()))
+
+
+def fetch_first_page(bucket, **kwargs):
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            return await api_client.fetch_page(session, os.environ['API_URL'], bucket, **kwargs)
+    return asyncio.run(fetch())
+
+
+def test_async_fetch_stores_every_page(stub, tmp_path):
+    page_store = api_client.PageStore(str(tmp_path), os.environ['API_URL'], 'async')
+    assert api_client.fetch_pages_to_store(os.environ['API_URL'], 'key', page_store) == 95
+    assert stored_records(page_store) == stub['records']
+
+
+def test_async_fetch_resumes_a_sync_checkpoint(stub, tmp_path):
+    api_url = os.environ['API_URL']
+    # A sync attempt that stopped after two pages: it records the next URL, but no count or page size
+    sync_store = api_client.PageStore(str(tmp_path), api_url, 'sync')
+    sync_store.save_page(1, stub['records'][:10], f"{api_url}&page=2")
+    sync_store.save_page(2, stub['records'][10:20], f"{api_url}&page=3")
+
+    page_store = api_client.PageStore(str(tmp_path), api_url, 'async')
+    assert page_store.is_done(2)
+    assert api_client.fetch_pages_to_store(api_url, 'key', page_store) == 95
+    assert sorted(page_store.state['completed_pages']) == list(range(1, 11))
+    assert stored_records(page_store) == stub['records']
+
+
+def test_sync_fetch_discards_an_async_checkpoint(stub, tmp_path):
+    api_url = os.environ['API_URL']
+    async_store = api_client.PageStore(str(tmp_path), api_url, 'async')
+    async_store.save_page(1, stub['records'][:10], None, 95, 10)
+    async_store.save_page(5, stub['records'][40:50])
+
+    page_store = api_client.PageStore(str(tmp_path), api_url, 'sync')
+    assert page_store.state['completed_pages'] == []
+    assert page_store.state['next_url'] == api_url
+
+
+def test_fetch_page_waits_out_rate_limits_and_retries_server_errors(stub, errors):
+    errors.extend([(429, {'Retry-After': '0.3'}), (503, {})])
+    bucket = api_client.TokenBucket(1000, 1000)
+    assert fetch_first_page(bucket)['results'] == stub['records'][:PAGE_SIZE]
+    assert errors == []
+    assert bucket.wait_time >= 0.3
+
+
+def test_fetch_page_gives_up_after_max_retries(stub, errors):
+    errors.extend([(503, {})] * 3)
+    with pytest.raises(RuntimeError, match='after 2 retries'):
+        fetch_first_page(api_client.TokenBucket(1000, 1000), max_retries=2)
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert api_client.retry_after_delay('2', 0) == 2.0
+    in_three_seconds = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=3), usegmt=True)
+    assert 1 < api_client.retry_after_delay(in_three_seconds, 0) <= 3
+    assert api_client.retry_after_delay('Wed, 21 Oct 2015 07:28:00 GMT', 0) == 0
+    # Anything else falls back to the jittered backoff
+    assert 0 <= api_client.retry_after_delay('soon', 0) <= api_client.API_BACKOFF_BASE
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+from minifig_etl import storage
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_chunked_csv_conversion_keeps_one_type_per_column(tmp_path, monkeypatch, fmt):
+    """A COPY export converted chunk by chunk: early chunks hold only numeric part numbers, a later one '3001pr9'"""
+    monkeypatch.setattr(storage, 'STORAGE_FORMAT', fmt)
+    csv_path = tmp_path / 'inventory_parts.copy.csv'
+    pd.DataFrame({
+        'inventory_id': [1, 1, 2, 2, 3, 3],
+        'part_num': ['3001', '3002', '3003', '03004', '3001pr9', '973c01'],
+        'color_id': [4, 4, 1, 1, 15, 0],
+        'quantity': [2, 1, 4, 1, 1, 3],
+        'is_spare': ['f', 'f', 'f', 't', 'f', 'f'],
+        'img_url': ['', '', '', '', '', ''],
+    }).to_csv(csv_path, index=False)
+
+    folder = str(tmp_path / 'raw')
+    dtypes = storage.csv_dtypes('inventory_parts', pd.read_csv(csv_path, nrows=0).columns)
+    chunks = pd.read_csv(csv_path, chunksize=2, dtype=dtypes, true_values=['t'], false_values=['f'])
+    for i, chunk in enumerate(chunks):
+        storage.write_table(chunk, folder, 'inventory_parts', append=i > 0)
+
+    df = storage.read_table(folder, 'inventory_parts')
+    assert df['part_num'].tolist() == ['3001', '3002', '3003', '03004', '3001pr9', '973c01']
+    assert df['is_spare'].tolist() == [False, False, False, True, False, False]
+    assert df['img_url'].isna().all()
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from minifig_etl import storage, validation
+from synthetic_data import generate
+
+
+CHUNK_ROWS = 100
+
+
+@pytest.fixture
+def raw(monkeypatch, tmp_path):
+    monkeypatch.setattr(validation, 'QUARANTINE_DIR', str(tmp_path / 'quarantine'))
+    tables = generate(0.2, seed=7)
+    # One broken chunk: a tenth of its set names missing, far above the 1% limit of TABLE_RULES
+    sets = tables['sets']
+    sets.loc[sets.index[CHUNK_ROWS:2 * CHUNK_ROWS:10], 'name'] = None
+    return tables
+
+
+def test_null_rate_breach_quarantines_only_the_breaching_chunk(monkeypatch, raw):
+    monkeypatch.setattr(validation, 'DATA_VALIDATION', 'quarantine')
+    validator = validation.Validator('sets', 'transform', {'themes': raw['themes']})
+    checked = validator.check_table(raw['sets'], CHUNK_ROWS)
+    report = validator.finish()
+
+    assert report['null_rate_chunks'] == 1
+    assert checked.index.tolist() == [*range(CHUNK_ROWS), *range(2 * CHUNK_ROWS, len(raw['sets']))]
+    quarantined = storage.read_table(validator.quarantine_folder, 'sets')
+    assert quarantined['set_num'].tolist() == raw['sets']['set_num'].iloc[CHUNK_ROWS:2 * CHUNK_ROWS].tolist()
+    assert np.all(quarantined['violation'] == 'null_rate_name')
+
+
+def test_quarantining_most_of_a_table_fails_the_run(monkeypatch, raw):
+    monkeypatch.setattr(validation, 'DATA_VALIDATION', 'quarantine')
+    sets = raw['sets'].assign(name=None)
+    validator = validation.Validator('sets', 'transform', {'themes': raw['themes']})
+    assert validator.check_table(sets, CHUNK_ROWS).empty
+    with pytest.raises(ValueError, match='QUARANTINE_MAX_SHARE'):
+        validator.finish()
+
+
+def test_null_rate_breach_is_only_counted_in_report_mode(monkeypatch, raw):
+    monkeypatch.setattr(validation, 'DATA_VALIDATION', 'report')
+    validator = validation.Validator('sets', 'transform', {'themes': raw['themes']})
+    assert len(validator.check_table(raw['sets'], CHUNK_ROWS)) == len(raw['sets'])
+    assert validator.finish()['null_rate_chunks'] == 1
+
+
+def test_quarantine_diverts_only_the_offending_rows(monkeypatch, raw):
+    monkeypatch.setattr(validation, 'DATA_VALIDATION', 'quarantine')
+    inventory_sets = raw['inventory_sets']
+    inventory_sets.loc[inventory_sets.index[:3], 'set_num'] = 'missing-set'
+    validator = validation.Validator('inventory_sets', 'transform', {'inventories': raw['inventories'], 'sets': raw['sets']})
+    checked = validator.check(inventory_sets)
+    assert len(checked) == len(inventory_sets) - 3
+    quarantined = storage.read_table(validator.quarantine_folder, 'inventory_sets')
+    assert np.all(quarantined['violation'] == 'orphan_set_num')
+
+
+def test_reference_parents_are_added_transitively():
+    inputs = validation.with_reference_parents(['inventory_parts', 'parts', 'colors'], ['inventories', 'parts', 'part_categories', 'colors'])
+    assert inputs == ['inventory_parts', 'parts', 'colors', 'inventories', 'part_categories']
+    # Parents outside the raw layer are left out
+    assert validation.with_reference_parents(['sets'], ['parts']) == ['sets']
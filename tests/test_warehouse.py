@@ -0,0 +1,26 @@
+import pandas as pd
+import pytest
+
+from minifig_etl import warehouse
+
+
+def test_deduplicate_keys_keeps_the_first_row_per_key():
+    df = pd.DataFrame({
+        'partNumber': ['3001', '3002', '3001', '3003', '3003'],
+        'partName': ['Brick 2 x 4', 'Brick 2 x 3', 'Brick 2 x 4 (old name)', 'Brick 2 x 2', 'Brick 2 x 2'],
+    })
+    result = warehouse.deduplicate_keys(df, ['partNumber'], 'parts_dim', on_conflict='first')
+    assert result['partNumber'].tolist() == ['3001', '3002', '3003']
+    assert result['partName'].tolist() == ['Brick 2 x 4', 'Brick 2 x 3', 'Brick 2 x 2']
+
+
+def test_deduplicate_keys_can_refuse_conflicting_rows():
+    df = pd.DataFrame({'colorId': [1, 1], 'colorName': ['Blue', 'Dark Blue']})
+    with pytest.raises(ValueError, match='share a natural key'):
+        warehouse.deduplicate_keys(df, ['colorId'], 'colors_dim', on_conflict='fail')
+
+
+def test_deduplicate_keys_drops_exact_duplicates_even_when_strict():
+    df = pd.DataFrame({'colorId': [1, 1, 2], 'colorName': ['Blue', 'Blue', 'Red']})
+    result = warehouse.deduplicate_keys(df, ['colorId'], 'colors_dim', on_conflict='fail')
+    assert result['colorId'].tolist() == [1, 2]